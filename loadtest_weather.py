@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""Load test the weather download against a local stand-in for the providers.
+
+Usage:
+    loadtest_weather.py [options]
+    loadtest_weather.py (-h | --help)
+
+A stub server on localhost answers for Weather.gov (DWML XML), AccuWeather
+(5-day JSON) and WMO (city JSON), so the test runs entirely offline. Every
+simulated display fetches its forecast and fills the template through the
+real WeatherGetter code in src/weather/bin/download_weather.py, as it would
+on a Kindle; each round is one update of every display.
+
+Options:
+    -h --help                   Show this screen.
+    -n <count>, --displays <count>  Number of displays. [default: 100]
+    --providers <names>         Comma-separated providers the displays use, in
+                                turn. [default: weather.gov,accuweather,wmo]
+    --locations <count>         Distinct locations per provider. [default: 20]
+    --rounds <count>            Updates of every display. [default: 3]
+    --concurrency <count>       Displays updating at once. [default: 20]
+    --batch                     Fetch the Weather.gov displays of each round with
+                                multi-point requests.
+    --no-cache                  Don't share a forecast cache between displays.
+    --max-age <seconds>         Use cached forecasts up to this old. [default: 3000]
+    --breaker                   Share provider circuit breakers between displays.
+    --latency <ms>              Mean latency of each response. [default: 200]
+    --jitter <ms>               Spread of the latency either way. [default: 100]
+    --throttle-rate <fraction>  Share of requests answered 429. [default: 0]
+    --error-rate <fraction>     Share of requests answered 503. [default: 0]
+    --quota <requests>          Requests each provider serves before answering
+                                429 to everything; 0 for no quota. [default: 0]
+    --timeout <seconds>         Network timeout for each request. [default: 10]
+    --seed <number>             Seed for the random latencies and errors.
+                                [default: 0]
+    -v, --verbose               Show the download log.
+"""
+
+import importlib.util
+import json
+import logging
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from string import Template
+from typing import Any, List, NamedTuple, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+HERE = Path(__file__).parent
+SOURCE = HERE / "src/weather/bin/download_weather.py"
+TEMPLATE = HERE / "src/weather/usr/share/weather/weather_template.svg"
+
+
+def load_download_weather() -> Any:
+    """Import download_weather.py, which isn't an importable module."""
+    spec = importlib.util.spec_from_file_location("download_weather", str(SOURCE))
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+dw = load_download_weather()
+docopt = dw.docopt
+# the base class needs a name mypy can resolve, as dw is only loaded at runtime
+ForecastCache: Any = dw.ForecastCache
+
+NDFD_PATH = "/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php"
+ACCUWEATHER_PREFIX = "/forecasts/v1/daily/5day/"
+WMO_PREFIX = "/en/json/"
+
+NDFD_ICONS = ["skc", "few", "sct", "bkn", "ovc", "ra", "tsra", "sn"]
+ACCUWEATHER_ICONS = [1, 3, 6, 7, 12, 15, 19, 22]
+WMO_ICONS = [2402, 2301, 901, 1401, 2201, 1601]
+
+
+class StubConfig(NamedTuple):
+    latency: float
+    jitter: float
+    throttle_rate: float
+    error_rate: float
+    quota: int
+
+
+def _seed(location: str) -> random.Random:
+    # the same location always gets the same forecast
+    return random.Random(zlib.crc32(location.encode()))
+
+
+def dwml(locations: Sequence[str]) -> bytes:
+    """A DWML response with a 4-day forecast for each location."""
+    start = date.today()
+    times = "".join(
+        f"<start-valid-time>{start + timedelta(days=i)}T06:00:00-04:00"
+        "</start-valid-time>"
+        for i in range(4)
+    )
+    parts = [
+        '<?xml version="1.0"?>\n<dwml version="1.0"><data>',
+        '<time-layout time-coordinate="local" summarization="24hourly">'
+        f"<layout-key>k-p24h-n4-1</layout-key>{times}</time-layout>",
+    ]
+    for number, location in enumerate(locations, 1):
+        rng = _seed(location)
+        highs = [rng.randint(50, 95) for _ in range(4)]
+
+        def values(items) -> str:
+            return "".join(f"<value>{item}</value>" for item in items)
+
+        summaries = "".join(
+            '<weather-conditions weather-summary="%s"/>' % rng.choice(["Sunny", "Rain"])
+            for _ in range(4)
+        )
+        icons = "".join(
+            "<icon-link>http://www.nws.noaa.gov/weather/images/fcicons/"
+            f"{rng.choice(NDFD_ICONS)}.jpg</icon-link>"
+            for _ in range(4)
+        )
+        parts.append(
+            f"<location><location-key>point{number}</location-key></location>"
+            f'<parameters applicable-location="point{number}">'
+            f'<temperature type="maximum">{values(highs)}</temperature>'
+            '<temperature type="minimum">'
+            f"{values(high - rng.randint(5, 25) for high in highs)}</temperature>"
+            "<probability-of-precipitation>"
+            f"{values(rng.randrange(0, 101, 10) for _ in range(8))}"
+            "</probability-of-precipitation>"
+            f"<weather>{summaries}</weather>"
+            f"<conditions-icon>{icons}</conditions-icon>"
+            "</parameters>"
+        )
+    parts.append("</data></dwml>")
+    return "".join(parts).encode()
+
+
+def accuweather(location: str) -> bytes:
+    """An AccuWeather 5-day forecast response."""
+    rng = _seed(location)
+    start = date.today()
+    days = []
+    for i in range(5):
+        high = rng.uniform(10, 35)
+        days.append(
+            {
+                "Date": f"{start + timedelta(days=i)}T07:00:00-04:00",
+                "Temperature": {
+                    "Minimum": {"Value": round(high - rng.uniform(3, 12), 1)},
+                    "Maximum": {"Value": round(high, 1)},
+                },
+                "Day": {
+                    "Icon": rng.choice(ACCUWEATHER_ICONS),
+                    "IconPhrase": "Partly sunny",
+                    "PrecipitationProbability": rng.randrange(0, 101, 5),
+                    "Wind": {
+                        "Speed": {"Value": round(rng.uniform(0, 40), 1)},
+                        "Direction": {"Localized": rng.choice(["N", "SW", "E"])},
+                    },
+                },
+            }
+        )
+    return json.dumps(
+        {
+            "Headline": {
+                "EffectiveDate": f"{start}T07:00:00-04:00",
+                "Text": "Pleasant this week",
+            },
+            "DailyForecasts": days,
+        }
+    ).encode()
+
+
+def wmo(location: str) -> bytes:
+    """A WMO city forecast response."""
+    rng = _seed(location)
+    start = date.today()
+    days = []
+    for i in range(5):
+        high = rng.randint(10, 35)
+        days.append(
+            {
+                "forecastDate": str(start + timedelta(days=i)),
+                "weather": "Sunny",
+                "minTemp": str(high - rng.randint(3, 12)),
+                "maxTemp": str(high),
+                "weatherIcon": rng.choice(WMO_ICONS),
+            }
+        )
+    return json.dumps({"city": {"forecast": {"forecastDay": days}}}).encode()
+
+
+class StubProviders(ThreadingHTTPServer):
+    """A local server answering like all three providers."""
+
+    daemon_threads = True
+    # the default backlog of 5 overflows at any real concurrency, and the
+    # clients' SYN retransmits would be measured instead of the downloader
+    request_queue_size = 1024
+
+    def __init__(self, config: StubConfig, seed: int):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.config = config
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.responses: Counter = Counter()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def outcome(self, provider: str) -> Tuple[float, int]:
+        """Count a request, and decide how long it takes and how it ends."""
+        config = self.config
+        with self.lock:
+            self.requests[provider] += 1
+            delay = max(
+                0.0, config.latency + self.random.uniform(-1, 1) * config.jitter
+            )
+            roll = self.random.random()
+            if config.quota and self.requests[provider] > config.quota:
+                status = 429
+            elif roll < config.throttle_rate:
+                status = 429
+            elif roll < config.throttle_rate + config.error_rate:
+                status = 503
+            else:
+                status = 200
+            self.responses[provider, status] += 1
+        return delay, status
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubProviders
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == NDFD_PATH:
+            provider, content_type = "weather.gov", "application/xml"
+            if "listLatLon" in query:
+                locations = query["listLatLon"][0].split()
+            elif "zipCodeList" in query:
+                locations = query["zipCodeList"][0].split()
+            else:
+                locations = [f"{query['lat'][0]},{query['lon'][0]}"]
+
+            def body() -> bytes:
+                return dwml(locations)
+
+        elif url.path.startswith(ACCUWEATHER_PREFIX):
+            provider, content_type = "accuweather", "application/json"
+            location = url.path[len(ACCUWEATHER_PREFIX) :]
+
+            def body() -> bytes:
+                return accuweather(location)
+
+        elif url.path.startswith(WMO_PREFIX):
+            provider, content_type = "wmo", "application/json"
+            location = url.path[len(WMO_PREFIX) :]
+
+            def body() -> bytes:
+                return wmo(location)
+
+        else:
+            self.send_error(404)
+            return
+
+        delay, status = self.server.outcome(provider)
+        time.sleep(delay)
+        if status != 200:
+            self.send_error(status)
+            return
+        data = body()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CountingCache(ForecastCache):
+    """A forecast cache that counts its hits and misses."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.lookups: Counter = Counter()
+
+    def get(self, key, stale=False):
+        forecast = super().get(key, stale)
+        with self.lock:
+            kind = "stale" if stale else "fresh"
+            self.lookups[kind, forecast is not None] += 1
+        return forecast
+
+
+class Display(NamedTuple):
+    provider: str
+    location: str
+
+
+class Update(NamedTuple):
+    display: Display
+    seconds: float
+    exit_code: int
+
+
+def make_displays(
+    count: int, providers: Sequence[str], locations: int
+) -> List[Display]:
+    """Spread displays over the providers, and over locations within each."""
+    displays = []
+    for i in range(count):
+        provider = providers[i % len(providers)]
+        index = i // len(providers) % locations
+        if provider == "weather.gov":
+            location = f"{10001 + index:05}"
+        elif provider == "accuweather":
+            location = str(349727 + index)
+        else:
+            location = str(1 + index)
+        displays.append(Display(provider, location))
+    return displays
+
+
+def make_getter(display: Display, **kwargs):
+    if display.provider == "weather.gov":
+        return dw.WeatherGovGetter(dw.ZipCode(display.location), **kwargs)
+    if display.provider == "accuweather":
+        return dw.AccuWeatherGetter(
+            dw.APIKey("loadtest"), dw.LocationKey(display.location), **kwargs
+        )
+    return dw.WMOGetter(dw.CityID(int(display.location)), **kwargs)
+
+
+def update(getter, display: Display, template: Template, started: float) -> Update:
+    """Fill the template for one display, as one run of the update would."""
+    try:
+        getter.fill_template(template)
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    return Update(display, time.monotonic() - started, code)
+
+
+def run_round(
+    displays: Sequence[Display],
+    template: Template,
+    pool: ThreadPoolExecutor,
+    batch: bool,
+    **kwargs,
+) -> List[Update]:
+    """Update every display once.
+
+    With `batch`, every display's update is timed from the start of the round,
+    since they all wait for the multi-point requests.
+    """
+    round_started = time.monotonic()
+    getters = [make_getter(display, **kwargs) for display in displays]
+    failed: Set = set()
+    if batch:
+        weather_gov = [g for g in getters if isinstance(g, dw.WeatherGovGetter)]
+        try:
+            failed = set(
+                dw.WeatherGovGetter.get_weather_batch(weather_gov, kwargs["timeout"])
+            )
+        except SystemExit:
+            # the getters without a forecast fetch on their own
+            pass
+
+    def run(pair) -> Update:
+        getter, display = pair
+        started = round_started if batch else time.monotonic()
+        if getter in failed:
+            # the batch request failed, as run_batch would report it
+            code = dw.Sysexits.EX_UNAVAILABLE.value
+            return Update(display, time.monotonic() - started, code)
+        return update(getter, display, template, started)
+
+    return list(pool.map(run, zip(getters, displays)))
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """The nearest-rank percentile of some values."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(int(-(-fraction * len(ordered) // 1)), 1)
+    return ordered[rank - 1]
+
+
+def report(
+    updates: Sequence[Update],
+    server: StubProviders,
+    cache: Optional[CountingCache],
+    elapsed: float,
+):
+    failed = Counter(u.exit_code for u in updates if u.exit_code)
+    print(
+        f"updates:  {len(updates)} in {elapsed:.1f} s, "
+        f"{len(updates) - sum(failed.values())} ok"
+        + "".join(f", {n} exited {code}" for code, n in sorted(failed.items()))
+    )
+    print("upstream requests:")
+    for provider in sorted(server.requests):
+        statuses = ", ".join(
+            f"{n} x {status}"
+            for (name, status), n in sorted(server.responses.items())
+            if name == provider
+        )
+        print(f"    {provider:12} {server.requests[provider]:6} ({statuses})")
+    if cache is not None:
+        hits = cache.lookups["fresh", True]
+        lookups = hits + cache.lookups["fresh", False]
+        print(
+            f"cache hits:  {hits} of {lookups}"
+            f" ({100 * hits / lookups if lookups else 0:.1f}%),"
+            f" stale fallbacks {cache.lookups['stale', True]}"
+        )
+    latencies = [u.seconds * 1000 for u in updates]
+    print(
+        f"update latency:  p50 {percentile(latencies, 0.5):.1f} ms,"
+        f" p99 {percentile(latencies, 0.99):.1f} ms,"
+        f" max {max(latencies, default=0):.1f} ms"
+    )
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak memory:  {peak / 1024:.1f} MiB (including the stub server)")
+
+
+def main(argv: List[str]) -> Optional[int]:
+    arguments = docopt(__doc__, argv=argv[1:])
+
+    if not arguments["--verbose"]:
+        dw.logger.setLevel(logging.CRITICAL)
+
+    try:
+        config = StubConfig(
+            latency=float(arguments["--latency"]) / 1000,
+            jitter=float(arguments["--jitter"]) / 1000,
+            throttle_rate=float(arguments["--throttle-rate"]),
+            error_rate=float(arguments["--error-rate"]),
+            quota=int(arguments["--quota"]),
+        )
+        displays = make_displays(
+            int(arguments["--displays"]),
+            arguments["--providers"].split(","),
+            int(arguments["--locations"]),
+        )
+        rounds = int(arguments["--rounds"])
+        concurrency = int(arguments["--concurrency"])
+        timeout = float(arguments["--timeout"])
+        max_age = float(arguments["--max-age"])
+        seed = int(arguments["--seed"])
+    except ValueError as e:
+        print(f"Invalid option: {e}", file=sys.stderr)
+        return dw.Sysexits.EX_USAGE.value
+
+    unknown = {display.provider for display in displays} - set(dw.PROVIDERS)
+    if unknown:
+        print(f"Unknown providers: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return dw.Sysexits.EX_USAGE.value
+
+    server = StubProviders(config, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for getter_class in dw.PROVIDERS.values():
+        getter_class.BASE_URL = server.url
+
+    template = Template(TEMPLATE.read_text())
+    health = dw.ProviderHealth() if arguments["--breaker"] else None
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = (
+            None
+            if arguments["--no-cache"]
+            else CountingCache(Path(cache_dir), max_age)
+        )
+        updates: List[Update] = []
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(rounds):
+                updates.extend(
+                    run_round(
+                        displays,
+                        template,
+                        pool,
+                        bool(arguments["--batch"]),
+                        timeout=timeout,
+                        cache=cache,
+                        health=health,
+                    )
+                )
+        report(updates, server, cache, time.monotonic() - started)
+
+    server.shutdown()
+    return None
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,69 @@
+#!/bin/sh
+# Cycle the screen through the weather and its extra PAGES, showing each
+# for CYCLE_INTERVAL seconds. Every page is rendered by update_weather.sh
+# along with the weather itself, so this only puts frames that are
+# already built up on the screen.
+
+cd /mnt/us/weather || exit 1
+
+CONFIG_DIR=etc
+CACHE_DIR=var/cache/weather
+WORK_DIR=/tmp/weather
+
+EIPS="/usr/sbin/eips"
+
+PID_FILE="$WORK_DIR/cycle.pid"
+LOCK_DIR="$WORK_DIR/update.lock"
+# the frame on the screen, so that update_weather.sh knows when it has to
+# redraw all of it
+SHOWING_FILE="$WORK_DIR/showing"
+
+# defaults; override them in weather_config.sh
+CYCLE_INTERVAL=60
+WAVEFORM=du
+
+# shellcheck source=../etc/weather_config.sh
+. "$CONFIG_DIR/weather_config.sh"
+
+_show_frame() {
+    # put a frame up, unless an update is drawing right now; the newest copy
+    # is the one in the working directory, and the one on flash is kept for
+    # after a reboot
+    _frame="$WORK_DIR/$1"
+    [ -e "$_frame" ] || _frame="$CACHE_DIR/$1"
+    if [ -d "$LOCK_DIR" ] || [ ! -e "$_frame" ]; then
+        return
+    fi
+    if [ -n "$BILEVEL" ]; then
+        "$EIPS" -g "$_frame" ${WAVEFORM:+"-w"} ${WAVEFORM:+"$WAVEFORM"}
+    else
+        # a full refresh keeps the gray levels from ghosting
+        "$EIPS" -f -g "$_frame"
+    fi
+    echo "$1" > "$SHOWING_FILE"
+}
+
+
+## Main
+if [ -z "$PAGES" ]; then
+    echo "No PAGES to cycle through" >&2
+    exit 78
+fi
+
+mkdir -p "$WORK_DIR" || exit 1
+if [ -e "$PID_FILE" ] && kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+    echo "Already cycling" >&2
+    exit 75
+fi
+echo "$$" > "$PID_FILE"
+
+while true; do
+    _n=0
+    for _page in $PAGES; do
+        _n=$((_n + 1))
+        sleep "$CYCLE_INTERVAL"
+        _show_frame "page_$_n.png"
+    done
+    sleep "$CYCLE_INTERVAL"
+    _show_frame weather.png
+done
@@ -2,62 +2,176 @@
 """Download Weather.
 
 Usage:
-    download_weather.py [-r | --rotated] [-t <template> | --template <template>] [--] <zip>
-    download_weather.py [-r | --rotated] [-t <template> | --template <template>] [--] <latitude> <longitude>
-    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] (-k <accuweather_key> | --key <accuweather_key>) [--] <location>
-    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [--] <city_id>
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] [--] <zip>
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] [--] <latitude> <longitude>
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] (-k <accuweather_key> | --key <accuweather_key>) [--] <location>
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] [--] <city_id>
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] (-b <manifest> | --batch <manifest>)
+    download_weather.py [-r | --rotated] [-m | --metric] [-t <template> | --template <template>] [options] [(-k <accuweather_key> | --key <accuweather_key>)] --consensus <sources>
+    download_weather.py [options] [(-k <accuweather_key> | --key <accuweather_key>)] --relay <address>
     download_weather.py (-h | --help)
     download_weather.py --version
 
+Each line of a batch manifest is an output file followed by a ZIP code or a
+latitude and longitude. Blank lines and lines starting with # are ignored.
+
+A consensus forecast merges the forecasts of a comma-separated list of
+<provider>:<location> sources: weather.gov with a ZIP code or <lat>/<lon>,
+accuweather with a location key (and --key), or wmo with a city ID.
+
+A relay listens on <host>:<port> and forwards the requests of displays started
+with --relay-url, sharing each response between them for --max-age seconds.
+Given --key, it sends its own AccuWeather API key upstream in place of theirs.
+
 Options:
     -h --help       Show this screen.
     --version       Show version.
     -r, --rotated   Rotate the output image 180 degrees.
-    -m, --metric    Output with metric units. (AccuWeather and WMO only.)
+    -m, --metric    Output with metric units.
+    --language <code>       Language of the day names, such as de or fr.
+                            [default: en]
     -t <template>, --template <template>   Template file. [default: -]
     -k, --key       AccuWeather API key.
+    -b <manifest>, --batch <manifest>   Fill the template for every Weather.gov
+                    location in a manifest file, with a few requests in total.
+    --timeout <seconds>     Network timeout for each request, and the longest a
+                            consensus waits for a provider. [default: 30]
+    --time-limit <seconds>  Give up after this many seconds in total. [default: 0]
+    --cache <directory>     Cache forecasts in this directory.
+    --max-age <seconds>     Use cached forecasts up to this old. [default: 3000]
+    --max-stale <seconds>   Fall back to cached forecasts up to this old when a
+                            provider is down. [default: 86400]
+    --health <file>         Keep track of which providers are down in this file.
+    --dns-cache <file>      Remember host name lookups in this file.
+    --dns-ttl <seconds>     Look host names up again after this long.
+                            [default: 3600]
+    --framebuffer <device>  Render straight into this framebuffer device (or
+                            file) instead of printing the SVG.
+    --invert                Invert the gray levels written to the framebuffer.
+    --refresh <command>     Run this command after writing the framebuffer to
+                            refresh the screen.
+    --png <file>            Render to a grayscale PNG instead of printing the
+                            SVG.
+    --bilevel               Dither the rendered image to pure black and white,
+                            so the screen can use its fast waveforms.
+    --pages <pages>         Fill more templates from the same forecast: a
+                            comma-separated list of <template>:<output> pairs.
+                            Outputs ending in .png are rendered.
+    --metrics <file>        Add this run's counters and timings to a Prometheus
+                            textfile.
+    --consensus <sources>   Merge the forecasts of several providers.
+    --policy <policy>       How to merge a consensus: median or priority.
+                            [default: median]
+    --record <archive>      Record every response, and how long it took, to a
+                            replay archive.
+    --replay <archive>      Answer every request from a replay archive instead
+                            of the network, as slowly as it was recorded.
+    --replay-fast           Replay responses without their recorded delays.
+    --low-memory            Keep as little in memory as possible: download
+                            first, then fill the template a line at a time
+                            into the output or the renderer.
+    --diff <file>           Compare the forecast with the one recorded in this
+                            file, then record it there with the changes and
+                            the refresh they need: none, footer, text, icons
+                            or full.
+    --relay <address>       Relay provider requests for other displays.
+    --relay-url <url>       Send provider requests through the relay at this
+                            URL, such as http://192.168.1.10:8080.
 
 Exit Codes:
     0   Success.
     1   General error.
     64  Usage - problem with command arguments.
+    65  Data error - problem parsing weather data.
+    66  No input - problem reading the batch manifest or replay archive.
     69  Unavailable - problem downloading weather data.
+    70  Software error - problem rendering the weather.
+    71  OS error - out of memory, problem refreshing the screen, or problem
+        starting the relay.
+    72  OS file error - problem loading the renderer.
+    73  Can't create - problem writing a batch output file.
+    74  I/O error - problem writing to the framebuffer or PNG.
+    75  Temporary failure - time limit exceeded.
+    78  Configuration error - unsupported framebuffer.
 """
 
 from __future__ import annotations
 
+import atexit
+import base64
+import ctypes
+import ctypes.util
+import email.message
 import enum
+import errno
+import fcntl
+import gzip
+import hashlib
+import ipaddress
 import json
 import logging
+import math
+import mmap
 import os
+import random
 import re
+import resource
+import selectors
+import shlex
+import signal
+import socket
 import ssl
+import stat
+import statistics
+import struct
+import subprocess
 import sys
+import threading
+import time
 import urllib.parse
 import urllib.request
+import urllib.response
+import zlib
 from abc import ABC, abstractmethod
-from contextlib import closing
+from contextlib import closing, contextmanager, nullcontext
 from datetime import date, datetime, timedelta
+from functools import partial
+from http.client import HTTPResponse, HTTPSConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
 from itertools import count
 from operator import itemgetter
-from pathlib import Path, PurePosixPath
+from pathlib import Path
 from string import Template
 from typing import (
     cast,
+    Any,
+    BinaryIO,
+    Callable,
     Dict,
+    Iterable,
+    Iterator,
     List,
+    Mapping,
     NamedTuple,
     NewType,
     NoReturn,
     Optional,
+    Sequence,
     Tuple,
+    Type,
     Union,
 )
-from urllib.error import URLError
+from urllib.error import HTTPError, URLError
 from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
 
 HERE = Path(f"{__file__}").parent
-sys.path.insert(0, str((HERE / Path("../lib/python3.7/site-packages")).resolve()))
+if HERE.is_file():
+    # running from the precompiled zipapp, which bundles docopt
+    HERE = HERE.parent
+else:
+    sys.path.insert(0, str((HERE / Path("../lib/python3.7/site-packages")).resolve()))
 
 from docopt import docopt
 
@@ -76,7 +190,10 @@ Location = Union[LocationKey, ZipCode, LatLon, CityID]
 
 NOMESSAGE = object()
 
+DEFAULT_TIMEOUT = 30.0
+
 ZIP_RE = re.compile(r"(?P<zip>[0-9]{5})(?:-[0-9]{4})?")
+SVG_NS = "http://www.w3.org/2000/svg"
 
 SSL_CONTEXT = ssl.create_default_context(
     cafile=str((HERE / Path("../etc/ssl/certs/cacert.pem")).resolve())
@@ -110,435 +227,2507 @@ class Sysexits(enum.Enum):
     EX_CONFIG = 78
 
 
+class ResponseFormat(enum.Enum):
+    """Wire format of a provider's forecast response."""
+
+    XML = "xml"
+    JSON = "json"
+
+
+class XMLPath:
+    """A path into an XML document, compiled once and matched while streaming.
+
+    A path is a ``/``-separated list of tags, each optionally followed by a single
+    ``[@attribute='value']`` predicate. Like an ElementTree ``.//`` path, it matches
+    anywhere in the document. A final ``@attribute`` step selects that attribute
+    instead of the element text.
+    """
+
+    STEP_RE = re.compile(
+        r"(?P<tag>[\w.-]+)(?:\[@(?P<attr>[\w.-]+)=(?P<quote>['\"]?)(?P<value>[^'\"\]]*)(?P=quote)\])?"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+
+        *steps, last = path.split("/")
+        self.attribute: Optional[str] = None
+        if last.startswith("@"):
+            self.attribute = last[1:]
+        else:
+            steps.append(last)
+
+        compiled = []
+        for step in steps:
+            match = self.STEP_RE.fullmatch(step)
+            if not match:
+                raise ValueError(f"Invalid XML path step {step!r} in {path!r}")
+            compiled.append(
+                (match.group("tag"), match.group("attr"), match.group("value"))
+            )
+        self.steps: Tuple[Tuple[str, Optional[str], Optional[str]], ...] = tuple(
+            reversed(compiled)
+        )
+
+    @property
+    def tag(self) -> str:
+        return self.steps[0][0]
+
+    def matches(self, stack: List[ET.Element]) -> bool:
+        """Check whether the innermost elements of ``stack`` match this path."""
+        if len(stack) < len(self.steps):
+            return False
+        for elem, (tag, attr, value) in zip(reversed(stack), self.steps):
+            if elem.tag != tag or (attr is not None and elem.get(attr) != value):
+                return False
+        return True
+
+    def value(self, elem: ET.Element) -> Optional[str]:
+        return elem.get(self.attribute) if self.attribute else elem.text
+
+
+class JSONPath:
+    """A path into a decoded JSON document, compiled once.
+
+    A path is a ``.``-separated list of object keys; a ``*`` step maps the rest of
+    the path over a list. Missing keys produce ``None`` rather than an error.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys: Tuple[str, ...] = tuple(path.split(".")) if path else ()
+
+    def find(self, obj) -> List:
+        results = [obj]
+        for key in self.keys:
+            if key == "*":
+                results = [item for result in results for item in (result or ())]
+            else:
+                results = [
+                    result.get(key) if isinstance(result, dict) else None
+                    for result in results
+                ]
+        return results
+
+    def first(self, obj):
+        results = self.find(obj)
+        return results[0] if results else None
+
+
+ExtractionPath = Union[XMLPath, JSONPath]
+
+
+class Forecast(NamedTuple):
+    """A provider-independent daily forecast, extracted from a single response.
+
+    Temperatures are in degrees Celsius and wind speeds in km/h, whatever units
+    the provider used; they are converted for display when filling a template.
+    The extended fields are empty when a provider doesn't supply them.
+    """
+
+    first_date: date
+    highs: Tuple[Optional[float], ...]
+    lows: Tuple[Optional[float], ...]
+    icons: Tuple[str, ...]
+    pops: Tuple[str, ...] = ()
+    wind_speeds: Tuple[Optional[float], ...] = ()
+    wind_directions: Tuple[str, ...] = ()
+    summaries: Tuple[str, ...] = ()
+    headline: str = ""
+
+    def to_json(self) -> Dict:
+        data = self._asdict()
+        data["first_date"] = self.first_date.isoformat()
+        return data
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Forecast":
+        return cls(
+            first_date=date.fromisoformat(data["first_date"]),
+            **cast(
+                Dict[str, Any],
+                {
+                    name: tuple(value) if isinstance(value, list) else value
+                    for name, value in data.items()
+                    if name != "first_date"
+                },
+            ),
+        )
+
+
+def atomic_write(path: Path, data: bytes) -> bool:
+    """Replace a file's contents in one step, unless they are the same already.
+
+    The data goes to a temporary file next to the target, which is then renamed
+    over it, so readers see either the old file or the new one and never a
+    partial write. Leaving an unchanged file alone spares the Kindle's flash.
+
+    :param path: The file to write
+    :param data: Its new contents
+
+    :returns: Whether the file was written
+    """
+    try:
+        with path.open("rb") as f:
+            if f.read(len(data) + 1) == data:
+                METRICS.inc("weather_unchanged_writes_total")
+                return False
+    except OSError:
+        pass
+
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with temporary.open("wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(str(temporary), str(path))
+    except BaseException:
+        try:
+            temporary.unlink()
+        except OSError:
+            pass
+        raise
+    return True
+
+
+class Metrics:
+    """Counters and latency histograms, for Prometheus' textfile collector.
+
+    Samples are kept under their names in the exposition format, such as
+    ``weather_fetches_total{provider="wmo",result="ok"}``, so that the file
+    written by earlier runs can be read back and added to: each run adds its
+    counts to those of the runs before it, as Prometheus expects of counters.
+    Gauges only ever hold the last run's value.
+    """
+
+    FAMILIES: Dict[str, Tuple[str, str]] = {
+        "weather_fetches_total": (
+            "counter",
+            "Forecast requests, by provider and result.",
+        ),
+        "weather_fetch_seconds": (
+            "histogram",
+            "Time to fetch and parse a forecast response, by provider.",
+        ),
+        "weather_parse_seconds": (
+            "histogram",
+            "Time to read and parse a forecast response, by provider.",
+        ),
+        "weather_received_bytes_total": (
+            "counter",
+            "Bytes of forecast responses received, by host.",
+        ),
+        "weather_cache_lookups_total": (
+            "counter",
+            "Forecast cache lookups, by result.",
+        ),
+        "weather_render_seconds": (
+            "histogram",
+            "Time to render a frame in-process.",
+        ),
+        "weather_refresh_seconds": (
+            "histogram",
+            "Time to refresh the screen after writing the framebuffer.",
+        ),
+        "weather_unchanged_writes_total": (
+            "counter",
+            "Outputs left alone because they had not changed.",
+        ),
+        "weather_failures_total": (
+            "counter",
+            "Runs that failed, by exit code.",
+        ),
+        "weather_consensus_left_out_total": (
+            "counter",
+            "Providers left out of a consensus forecast, failed or too slow.",
+        ),
+        "weather_consensus_deviation_degrees_total": (
+            "counter",
+            "Sum of how far each provider's temperatures were from the consensus.",
+        ),
+        "weather_consensus_temperatures_total": (
+            "counter",
+            "Temperatures compared with the consensus, by provider.",
+        ),
+        "weather_consensus_icon_disagreements_total": (
+            "counter",
+            "Days on which a provider's icon differed from the consensus.",
+        ),
+        "weather_relay_requests_total": (
+            "counter",
+            "Requests relayed for displays, by provider and cache result.",
+        ),
+        "weather_relay_seconds": (
+            "histogram",
+            "Time to answer a relayed request, by provider.",
+        ),
+        "weather_peak_rss_bytes": (
+            "gauge",
+            "Peak resident memory of the last run.",
+        ),
+    }
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+    HISTOGRAM_SUFFIXES = ("_bucket", "_sum", "_count")
+
+    def __init__(self):
+        self.samples: Dict[str, Dict[str, float]] = {
+            family: {} for family in self.FAMILIES
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sample(name: str, labels: Dict[str, object]) -> str:
+        if not labels:
+            return name
+        pairs = ",".join(
+            '{}="{}"'.format(
+                key,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in sorted(labels.items())
+        )
+        return f"{name}{{{pairs}}}"
+
+    def inc(self, family: str, value: float = 1, **labels):
+        """Add to a counter.
+
+        :param family: The counter's name
+        :param value: The amount to add
+        :param **labels: The labels of the sample to add to
+        """
+        sample = self._sample(family, labels)
+        with self._lock:
+            samples = self.samples[family]
+            samples[sample] = samples.get(sample, 0) + value
+
+    def set(self, family: str, value: float, **labels):
+        """Set a gauge, which replaces what earlier runs recorded.
+
+        :param family: The gauge's name
+        :param value: Its value
+        :param **labels: The labels of the sample to set
+        """
+        with self._lock:
+            self.samples[family][self._sample(family, labels)] = value
+
+    def observe(self, family: str, seconds: float, **labels):
+        """Record a duration in a histogram.
+
+        :param family: The histogram's name
+        :param seconds: The duration
+        :param **labels: The labels of the histogram to record it in
+        """
+        with self._lock:
+            samples = self.samples[family]
+            # every bucket is written, so the series exist from the first run
+            for bound in self.BUCKETS:
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                sample = self._sample(f"{family}_bucket", dict(labels, le=le))
+                samples[sample] = samples.get(sample, 0) + (seconds <= bound)
+            for suffix, value in (("_sum", seconds), ("_count", 1)):
+                sample = self._sample(family + suffix, labels)
+                samples[sample] = samples.get(sample, 0) + value
+
+    @contextmanager
+    def time(self, family: str, **labels) -> Iterator[None]:
+        """Time a block of code into a histogram, whether or not it succeeds."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(family, time.monotonic() - start, **labels)
+
+    def _family(self, sample: str) -> Optional[str]:
+        name = sample.partition("{")[0]
+        if name in self.samples:
+            return name
+        for suffix in self.HISTOGRAM_SUFFIXES:
+            if name.endswith(suffix) and name[: -len(suffix)] in self.samples:
+                return name[: -len(suffix)]
+        return None
+
+    def _sort_key(self, sample: str) -> Tuple[str, float]:
+        # buckets go in increasing order of their bounds
+        match = re.search(r'le="([^"]*)"', sample)
+        if not match:
+            return sample, 0.0
+        rest = sample[: match.start()] + sample[match.end() :]
+        return rest, float(match.group(1).replace("+Inf", "inf"))
+
+    def render(self, previous: str = "") -> str:
+        """Render the metrics in the Prometheus text format.
+
+        :param previous: The text written by earlier runs, to add to
+
+        :returns: The text
+        """
+        totals: Dict[str, Dict[str, float]] = {
+            family: dict(samples) for family, samples in self.samples.items()
+        }
+        for line in previous.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            sample, _, number = line.rpartition(" ")
+            family = self._family(sample)
+            if family is None or self.FAMILIES[family][0] == "gauge":
+                continue
+            try:
+                totals[family][sample] = totals[family].get(sample, 0) + float(number)
+            except ValueError:
+                continue
+
+        lines = []
+        for family, (kind, description) in self.FAMILIES.items():
+            if not totals[family]:
+                continue
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+            for sample in sorted(totals[family], key=self._sort_key):
+                value = float(totals[family][sample])
+                text = str(int(value)) if value.is_integer() else repr(value)
+                lines.append(f"{sample} {text}")
+        return "".join(f"{line}\n" for line in lines)
+
+    def write(self, path: Path):
+        """Add this run's metrics to a textfile, replacing it atomically.
+
+        :param path: The file to write
+        """
+        try:
+            previous = path.read_text()
+        except (OSError, ValueError):
+            previous = ""
+        try:
+            atomic_write(path, self.render(previous).encode())
+        except OSError as e:
+            logger.warning("Failed to write metrics to %s: %s", path, e)
+
+
+METRICS = Metrics()
+
+
+class CountingReader:
+    """A response wrapper that counts the bytes read into `METRICS`."""
+
+    def __init__(self, source: BinaryIO, host: str):
+        self.source = source
+        self.host = host
+
+    def read(self, size: int = -1) -> bytes:
+        # HTTPResponse.read() only takes -1 for "everything" from Python 3.8
+        data = self.source.read(size) if size >= 0 else self.source.read()
+        METRICS.inc("weather_received_bytes_total", len(data), host=self.host)
+        return data
+
+
+class ForecastCache:
+    """On-disk cache of extracted forecasts, keyed by `WeatherGetter.cache_key`.
+
+    Getters that share a cache directory share forecasts, so displays that
+    snap to the same location only fetch it once.
+    """
+
+    def __init__(self, directory: Path, max_age: float, max_stale: float = 86400):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_stale = max_stale
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+    def get(self, key: str, stale: bool = False) -> Optional[Forecast]:
+        """Get a cached forecast, if there is one younger than `max_age`.
+
+        :param key: The cache key
+        :param stale: Whether to accept a forecast up to `max_stale` old, when
+            there is no way to get a fresh one
+
+        :returns: The forecast, or None if there isn't one that is recent enough
+        """
+        path = self._path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age > (self.max_stale if stale else self.max_age):
+                raise LookupError(key)
+            with path.open() as f:
+                forecast = Forecast.from_json(json.load(f))
+        except (OSError, ValueError, LookupError, TypeError):
+            METRICS.inc(
+                "weather_cache_lookups_total", result="stale_miss" if stale else "miss"
+            )
+            return None
+        METRICS.inc("weather_cache_lookups_total", result="stale" if stale else "hit")
+        if stale:
+            logger.warning(
+                "Using stale forecast for %s (%u minutes old)", key, age // 60
+            )
+        else:
+            logger.info("Using cached forecast for %s", key)
+        return forecast
+
+    def put(self, key: str, forecast: Forecast):
+        path = self._path(key)
+        data = json.dumps(forecast.to_json(), separators=(",", ":")).encode()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if not atomic_write(path, data):
+                # still fresh, even if the forecast hasn't changed
+                os.utime(str(path))
+        except OSError as e:
+            logger.warning("Failed to cache forecast for %s: %s", key, e)
+
+
+class ProviderHealth:
+    """Circuit breakers for the providers, kept in a file between runs.
+
+    After `THRESHOLD` failures in a row, a provider's circuit opens and the
+    provider isn't tried again until a backoff has passed: `BASE_BACKOFF`
+    seconds, doubling with every further failure up to `MAX_BACKOFF`, less a
+    random jitter of up to half so that a fleet of displays doesn't come back
+    all at once. After that the circuit is half-open: the provider is tried
+    once more, closing the circuit if it works and opening it again for longer
+    if it doesn't.
+    """
+
+    THRESHOLD = 2
+    BASE_BACKOFF = 900
+    MAX_BACKOFF = 6 * 3600
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        if path is not None:
+            try:
+                with path.open() as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def state(self, name: str) -> str:
+        """The state of a provider's circuit: closed, open or half-open."""
+        entry = self.entries.get(name)
+        if entry is None or entry["failures"] < self.THRESHOLD:
+            return "closed"
+        return "open" if entry["open_until"] > time.time() else "half-open"
+
+    def allow(self, name: str) -> bool:
+        """Whether a provider should be tried now."""
+        state = self.state(name)
+        if state == "half-open":
+            logger.info(
+                "Trying %s again after %u failures",
+                name,
+                self.entries[name]["failures"],
+            )
+        return state != "open"
+
+    def retry_time(self, name: str) -> datetime:
+        """When an open circuit turns half-open."""
+        return datetime.fromtimestamp(self.entries[name]["open_until"])
+
+    def record_success(self, name: str):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self._save()
+
+    def record_failure(self, name: str):
+        with self.lock:
+            entry = self.entries.setdefault(name, {"failures": 0, "open_until": 0})
+            entry["failures"] += 1
+            if entry["failures"] >= self.THRESHOLD:
+                backoff = min(
+                    self.BASE_BACKOFF * 2 ** (entry["failures"] - self.THRESHOLD),
+                    self.MAX_BACKOFF,
+                )
+                entry["open_until"] = time.time() + random.uniform(backoff / 2, backoff)
+                logger.warning(
+                    "Not trying %s again until %s",
+                    name,
+                    self.retry_time(name).isoformat(timespec="minutes"),
+                )
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.path, json.dumps(self.entries).encode())
+        except OSError as e:
+            logger.warning("Failed to save provider health: %s", e)
+
+
+# exit codes that mean the provider, rather than us, is having trouble
+PROVIDER_FAILURES = frozenset(
+    [Sysexits.EX_UNAVAILABLE.value, Sysexits.EX_DATAERR.value]
+)
+
+
+def format_temperature(celsius: Optional[float], metric: bool) -> str:
+    """Format a temperature in whole degrees Celsius or Fahrenheit."""
+    if celsius is None:
+        return ""
+    value = celsius if metric else celsius * 1.8 + 32
+    return str(math.floor(value + 0.5))
+
+
+def format_wind(kmh: Optional[float], direction: str, metric: bool) -> str:
+    """Format a wind speed in km/h or mph, followed by its direction."""
+    if kmh is None:
+        return ""
+    if metric:
+        speed = f"{math.floor(kmh + 0.5)} km/h"
+    else:
+        speed = f"{math.floor(kmh / 1.609344 + 0.5)} mph"
+    return f"{speed} {direction}".rstrip()
+
+
+DEFAULT_LANGUAGE = "en"
+
+# day names from Monday to Sunday, indexed by `date.weekday`, so filling in a
+# day is a lookup instead of a strftime that depends on the Kindle's locale
+DAY_NAMES: Dict[str, Tuple[str, ...]] = {
+    "da": ("mandag", "tirsdag", "onsdag", "torsdag", "fredag", "lørdag", "søndag"),
+    "de": (
+        "Montag",
+        "Dienstag",
+        "Mittwoch",
+        "Donnerstag",
+        "Freitag",
+        "Samstag",
+        "Sonntag",
+    ),
+    "en": (
+        "Monday",
+        "Tuesday",
+        "Wednesday",
+        "Thursday",
+        "Friday",
+        "Saturday",
+        "Sunday",
+    ),
+    "es": ("lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"),
+    "fi": (
+        "maanantai",
+        "tiistai",
+        "keskiviikko",
+        "torstai",
+        "perjantai",
+        "lauantai",
+        "sunnuntai",
+    ),
+    "fr": ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"),
+    "it": (
+        "lunedì",
+        "martedì",
+        "mercoledì",
+        "giovedì",
+        "venerdì",
+        "sabato",
+        "domenica",
+    ),
+    "nb": ("mandag", "tirsdag", "onsdag", "torsdag", "fredag", "lørdag", "søndag"),
+    "nl": (
+        "maandag",
+        "dinsdag",
+        "woensdag",
+        "donderdag",
+        "vrijdag",
+        "zaterdag",
+        "zondag",
+    ),
+    "pl": (
+        "poniedziałek",
+        "wtorek",
+        "środa",
+        "czwartek",
+        "piątek",
+        "sobota",
+        "niedziela",
+    ),
+    "pt": (
+        "segunda-feira",
+        "terça-feira",
+        "quarta-feira",
+        "quinta-feira",
+        "sexta-feira",
+        "sábado",
+        "domingo",
+    ),
+    "sv": ("måndag", "tisdag", "onsdag", "torsdag", "fredag", "lördag", "söndag"),
+}
+
+
+PROVIDERS: Dict[str, Type["ProviderGetter"]] = {}
+
+
+def register(name: str) -> Callable[[Type["ProviderGetter"]], Type["ProviderGetter"]]:
+    """Class decorator adding a `ProviderGetter` to the provider registry.
+
+    :param name: The name to register the provider under
+
+    :returns: The decorator
+    """
+
+    def decorator(cls: Type[ProviderGetter]) -> Type[ProviderGetter]:
+        cls.NAME = name
+        PROVIDERS[name] = cls
+        return cls
+
+    return decorator
+
+
+class Resolver:
+    """Host name lookups, optionally remembered in a file between runs.
+
+    ``getaddrinfo`` doesn't tell us the TTL of the records it found, so every
+    entry is kept for the same `ttl`. An expired entry is looked up again; if
+    that lookup fails, the old addresses are still better than nothing.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = 3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries: Dict[str, Dict] = {}
+        if path is not None:
+            try:
+                with path.open() as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def resolve(self, host: str) -> List[Tuple[int, str]]:
+        """Look up the addresses of a host.
+
+        :param host: The host name
+
+        :returns: The (family, address) pairs of the host, in the order
+            ``getaddrinfo`` prefers them
+        """
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            family = socket.AF_INET6 if ip.version == 6 else socket.AF_INET
+            return [(family, str(ip))]
+
+        entry = self.entries.get(host)
+        if entry is not None and entry["expires"] > time.time():
+            return [(family, address) for family, address in entry["addresses"]]
+
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except OSError as e:
+            if entry is None:
+                raise
+            logger.warning("Using expired addresses for %s: %s", host, e)
+            return [(family, address) for family, address in entry["addresses"]]
+
+        addresses: List[Tuple[int, str]] = []
+        for family, _, _, _, sockaddr in infos:
+            address = (int(family), str(sockaddr[0]))
+            if address not in addresses:
+                addresses.append(address)
+        self.entries[host] = {
+            "expires": time.time() + self.ttl,
+            "addresses": addresses,
+        }
+        self._save()
+        return addresses
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.path, json.dumps(self.entries).encode())
+        except OSError as e:
+            logger.warning("Failed to save the DNS cache: %s", e)
+
+
+# how long to give each connection attempt before racing the next address, from
+# RFC 8305 (Happy Eyeballs)
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+
+def _interleave(addresses: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Alternate address families, starting with the preferred one."""
+    families: Dict[int, List[Tuple[int, str]]] = {}
+    for address in addresses:
+        families.setdefault(address[0], []).append(address)
+    queues = list(families.values())
+    interleaved: List[Tuple[int, str]] = []
+    while queues:
+        interleaved.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return interleaved
+
+
+def connect_racing(
+    resolver: Resolver,
+    address: Tuple[str, int],
+    timeout: object = None,
+    source_address: Optional[Tuple[str, int]] = None,
+) -> socket.socket:
+    """Connect to a host, racing its IPv6 and IPv4 addresses.
+
+    A drop-in for `socket.create_connection`: a new attempt starts every
+    `CONNECTION_ATTEMPT_DELAY` seconds, or as soon as the last one fails, and
+    the first connection made wins.
+
+    :param resolver: Where to look up the host
+    :param address: The host and port to connect to
+    :param timeout: Seconds to wait for a connection in total, then for each
+        operation on it
+    :param source_address: The local address to connect from, if any
+
+    :returns: The connected socket
+    """
+    host, port = address
+    if not isinstance(timeout, (int, float)):
+        timeout = None
+    deadline = None if timeout is None else time.monotonic() + timeout
+    candidates = _interleave(resolver.resolve(host))
+
+    errors: List[OSError] = []
+    next_attempt = time.monotonic()
+    with selectors.DefaultSelector() as selector:
+        try:
+            while candidates or selector.get_map():
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                if candidates and now >= next_attempt:
+                    family, ip = candidates.pop(0)
+                    sockaddr: Tuple = (ip, port)
+                    if family == socket.AF_INET6:
+                        sockaddr = (ip, port, 0, 0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    try:
+                        if source_address is not None:
+                            sock.bind(source_address)
+                        error = sock.connect_ex(sockaddr)
+                    except OSError as e:
+                        error = e.errno or errno.EINVAL
+                    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        errors.append(OSError(error, os.strerror(error), ip))
+                        sock.close()
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE, ip)
+                    next_attempt = now + CONNECTION_ATTEMPT_DELAY
+
+                waits = [] if deadline is None else [deadline - now]
+                if candidates:
+                    waits.append(max(next_attempt - now, 0))
+                for key, _ in selector.select(min(waits) if waits else None):
+                    sock = cast(socket.socket, key.fileobj)
+                    selector.unregister(sock)
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error == 0:
+                        sock.setblocking(True)
+                        sock.settimeout(timeout)
+                        return sock
+                    errors.append(OSError(error, os.strerror(error), key.data))
+                    sock.close()
+                    next_attempt = time.monotonic()
+        finally:
+            for key in list(selector.get_map().values()):
+                cast(socket.socket, key.fileobj).close()
+
+    if errors:
+        raise errors[-1]
+    raise socket.timeout(f"timed out connecting to {host}")
+
+
+class RacingHTTPSHandler(urllib.request.HTTPSHandler):
+    """Open HTTPS URLs with `connect_racing` and a shared `Resolver`."""
+
+    def __init__(self, resolver: Resolver, context: ssl.SSLContext):
+        super().__init__(context=context)
+        self.resolver = resolver
+        self.context = context
+
+    def _connection(self, host: str, **kwargs) -> HTTPSConnection:
+        connection = HTTPSConnection(host, **kwargs)
+        connection._create_connection = partial(  # type: ignore
+            connect_racing, self.resolver
+        )
+        return connection
+
+    def https_open(self, req: urllib.request.Request) -> HTTPResponse:
+        return self.do_open(self._connection, req, context=self.context)
+
+
+def use_resolver(resolver: Resolver, *handlers: urllib.request.BaseHandler):
+    """Make every request look up and connect to hosts through a resolver.
+
+    :param resolver: The resolver
+    :param *handlers: More handlers for the opener, such as a `Recorder`
+    """
+    urllib.request.install_opener(
+        urllib.request.build_opener(RacingHTTPSHandler(resolver, SSL_CONTEXT), *handlers)
+    )
+
+
+SECRET_PARAMETER_RE = re.compile(r"(?P<name>[?&]apikey=)[^&]*", re.IGNORECASE)
+
+
+def redact(url: str) -> str:
+    """Blank out the API key of a URL, so it stays out of recordings."""
+    return SECRET_PARAMETER_RE.sub(r"\g<name>REDACTED", url)
+
+
+def _replayed_response(
+    body: BinaryIO, url: str, status: int, reason: str, headers: List[List[str]]
+) -> urllib.response.addinfourl:
+    message = email.message.Message()
+    for name, value in headers:
+        message[name] = value
+    response = urllib.response.addinfourl(body, message, url, status)
+    # what urllib's error processing and `open_url` expect of a response
+    response.msg = response.reason = reason  # type: ignore
+    return response
+
+
+class Recorder(urllib.request.BaseHandler):
+    """Record every response, with its timing, to a replay archive.
+
+    The archive is gzipped JSON lines, one response each, with API keys
+    redacted from the URLs. Each body is read in full before it is handed on,
+    so that it can be recorded.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._started: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def http_request(self, request: urllib.request.Request) -> urllib.request.Request:
+        self._started[id(request)] = time.monotonic()
+        return request
+
+    def http_response(self, request: urllib.request.Request, response):
+        headers_time = time.monotonic()
+        body = response.read()
+        body_time = time.monotonic()
+        record = {
+            "url": redact(request.full_url),
+            "status": response.status,
+            "reason": response.reason,
+            "headers": [list(header) for header in response.getheaders()],
+            "wait": round(headers_time - self._started.pop(id(request), headers_time), 3),
+            "read": round(body_time - headers_time, 3),
+            "body": base64.b64encode(body).decode(),
+        }
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        try:
+            with self._lock, gzip.open(str(self.path), "at") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning("Failed to record a response to %s: %s", self.path, e)
+        return _replayed_response(
+            BytesIO(body),
+            response.geturl(),
+            response.status,
+            response.reason,
+            record["headers"],
+        )
+
+    https_request = http_request
+    https_response = http_response
+
+
+class PacedReader(BytesIO):
+    """A body that takes as long to read as it did when it was recorded."""
+
+    def __init__(self, data: bytes, seconds: float):
+        super().__init__(data)
+        self.seconds_per_byte = seconds / len(data) if data else 0.0
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        data = super().read(size)
+        time.sleep(len(data) * self.seconds_per_byte)
+        return data
+
+
+class Replayer(urllib.request.BaseHandler):
+    """Answer every request from a replay archive made by `Recorder`.
+
+    Responses to the same URL are replayed in the order they were recorded,
+    the last of them again and again once the others are used up. A URL that
+    was never recorded fails as if the network were down.
+    """
+
+    # ahead of the handlers that would go to the network
+    handler_order = 100
+
+    def __init__(self, path: Path, realtime: bool = True):
+        self.realtime = realtime
+        self.responses: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        try:
+            with gzip.open(str(path), "rt") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.responses.setdefault(record["url"], []).append(record)
+        except (OSError, EOFError, ValueError, LookupError) as e:
+            die(Sysexits.EX_NOINPUT, "Failed to read replay archive: %s", e)
+
+    def http_open(self, request: urllib.request.Request):
+        url = redact(request.full_url)
+        with self._lock:
+            records = self.responses.get(url)
+            if not records:
+                raise URLError(f"not in the replay archive: {url}")
+            record = records.pop(0) if len(records) > 1 else records[0]
+        body = base64.b64decode(record["body"])
+        if self.realtime:
+            time.sleep(record["wait"])
+            reader: BinaryIO = PacedReader(body, record["read"])
+        else:
+            reader = BytesIO(body)
+        return _replayed_response(
+            reader, request.full_url, record["status"], record["reason"], record["headers"]
+        )
+
+    https_open = http_open
+
+
+@contextmanager
+def open_url(url: str, timeout: float = DEFAULT_TIMEOUT) -> Iterator[BinaryIO]:
+    """Open a URL for streaming, exiting if the request fails.
+
+    :param url: The URL to open
+    :param timeout: Seconds to wait for the connection and for each read
+
+    :returns: A context manager yielding the open response
+    """
+    request = urllib.request.Request(url)
+    try:
+        with closing(
+            urllib.request.urlopen(request, timeout=timeout)
+        ) as resp:
+            resp_code = resp.getcode()
+            if resp_code // 100 != 2:
+                die(
+                    Sysexits.EX_UNAVAILABLE,
+                    "Failed to retrieve weather data: %u %s",
+                    resp_code,
+                    resp.reason,
+                )
+            yield cast(BinaryIO, CountingReader(resp, request.host))
+    except HTTPError as e:
+        die(
+            Sysexits.EX_UNAVAILABLE,
+            "Failed to retrieve weather data: %u %s",
+            e.code,
+            e.reason,
+        )
+    except URLError as e:
+        die(Sysexits.EX_UNAVAILABLE, "Failed to retrieve weather data: %s", e.reason)
+    except OSError as e:
+        # timeouts and resets while reading the body
+        die(Sysexits.EX_UNAVAILABLE, "Failed to retrieve weather data: %s", e)
+
+
+ICON_FALLBACK = "na"
+
+ICON_NAMES = frozenset(
+    [
+        "bkn",
+        "blizzard",
+        "cold",
+        "du",
+        "few",
+        "fg",
+        "fu",
+        "fzra",
+        "hi_shwrs",
+        "hot",
+        "ip",
+        "mix",
+        "ovc",
+        "ra",
+        "raip",
+        "rasn",
+        "sct",
+        "sctfg",
+        "scttsra",
+        "shra",
+        "skc",
+        "sn",
+        "tsra",
+        "wind",
+        ICON_FALLBACK,
+    ]
+)
+
+
+class IconTable:
+    """Dense lookup table from a provider's numeric icon codes to template icons.
+
+    The table is built once from a sparse code mapping; any code outside it,
+    including a missing one, normalizes to `ICON_FALLBACK` instead of failing
+    the run.
+    """
+
+    def __init__(self, mapping: Dict[int, str], fallback: str = ICON_FALLBACK):
+        self.fallback = fallback
+        # index 0 is never a real code, so it doubles as the fallback slot
+        self.table: Tuple[str, ...] = tuple(
+            mapping.get(code, fallback) if code else fallback
+            for code in range(max(mapping, default=0) + 1)
+        )
+
+    def _index(self, code) -> int:
+        if type(code) is not int:
+            code = int(code) if isinstance(code, str) and code.isdigit() else 0
+        if 0 < code < len(self.table) and self.table[code] != self.fallback:
+            return code
+        if code:
+            logger.warning("Unknown icon code: %s", code)
+        return 0
+
+    def __getitem__(self, code) -> str:
+        return self.table[self._index(code)]
+
+    def normalize(self, codes: Sequence) -> Tuple[str, ...]:
+        """Normalize a whole column of icon codes in one call."""
+        if not codes:
+            return ()
+        icons = itemgetter(*map(self._index, codes))(self.table)
+        return icons if len(codes) > 1 else (icons,)
+
+
+class NDFDIconTable(IconTable):
+    """Lookup table from NDFD icon URLs to template icons.
+
+    NDFD icon names carry a probability suffix (``tsra40.jpg``) and night
+    variants have an ``n`` prefix (``nsct.jpg``), after the ``hi_`` of the
+    "in the vicinity" icons (``hi_nshwrs.jpg``); both are dropped.
+    """
+
+    ICON_RE = re.compile(r"/(?P<name>[a-z_-]+?)\d*\.[a-z]+$")
+    NIGHT_RE = re.compile(r"^(?P<vicinity>hi_)?n(?P<name>.+)$")
+
+    ALIASES: Dict[str, str] = {
+        "hi_tsra": "scttsra",
+        "fzrara": "fzra",
+        "minus_ra": "ra",
+        "bknfg": "sctfg",
+        "svrtsra": "tsra",
+        "ra_sn": "rasn",
+        "ra_fzra": "fzra",
+        "fzra_sn": "mix",
+        "mist": "fg",
+        "dust": "du",
+        "smoke": "fu",
+        "haze": "fg",
+        "hz": "fg",
+        "br": "fg",
+        "hurr": "wind",
+        "hurr-noh": "wind",
+        "hur_warn": "wind",
+        "hur_watch": "wind",
+        "ts_warn": "wind",
+        "ts_watch": "wind",
+        "ts_nowarn": "wind",
+        "tor": "wind",
+        "fc": "wind",
+    }
+
+    def __init__(self, fallback: str = ICON_FALLBACK):
+        self.fallback = fallback
+        self.names: Dict[str, str] = dict(self.ALIASES)
+        self.names.update((name, name) for name in ICON_NAMES)
+
+    def __getitem__(self, url) -> str:
+        if not url:
+            return self.fallback
+        match = self.ICON_RE.search(url)
+        name = match.group("name") if match else ""
+        icon = self.names.get(name)
+        night = self.NIGHT_RE.match(name)
+        if icon is None and night:
+            icon = self.names.get((night.group("vicinity") or "") + night.group("name"))
+        if icon is None:
+            logger.warning("Unknown icon: %s", url)
+            icon = self.fallback
+        return icon
+
+    def normalize(self, codes: Sequence) -> Tuple[str, ...]:
+        return tuple(map(self.__getitem__, codes))
+
+
 class WeatherGetter(ABC):
+    """Base class for weather getters.
+
+    A getter gets the forecast for one location, caches it, and formats it for
+    the templates and the screen.
+    """
+
     NUMBERS = ["ONE", "TWO", "THREE", "FOUR"]
 
-    def __init__(self, location: Location, metric: bool = False):
-        self.location: Location = location
+    NAME: str
+
+    def __init__(
+        self,
+        location: Location,
+        metric: bool = False,
+        timeout: float = DEFAULT_TIMEOUT,
+        cache: Optional[ForecastCache] = None,
+        health: Optional[ProviderHealth] = None,
+        language: str = DEFAULT_LANGUAGE,
+    ):
+        self.location: Location = self.snap(location)
         self.metric = metric
+        self.timeout = timeout
+        self.cache = cache
+        self.health = health
+        self.day_names = DAY_NAMES[language]
+        # when this run made the screen, for its footer
+        self.updated = datetime.now().isoformat(timespec="seconds")
+
+        self._forecast: Optional[Forecast] = None
 
-        self._highs: Optional[Tuple[int, int, int, int]] = None
-        self._lows: Optional[Tuple[int, int, int, int]] = None
-        self._icons: Optional[Tuple[str, str, str, str]] = None
-        self._first_date: Optional[date] = None
+    @classmethod
+    def snap(cls, location: Location) -> Location:
+        """Normalize a location to the provider's native grid cell or station.
+
+        Nearby displays that snap to the same location share a cache key and a
+        request.
+        """
+        return location
+
+    @property
+    def cache_key(self) -> str:
+        if isinstance(self.location, LatLon):
+            location = f"{self.location.lat},{self.location.lon}"
+        else:
+            location = str(self.location)
+        return f"{self.NAME}/{location}"
 
     @abstractmethod
     def get_weather(self):
-        self._highs: Optional[Tuple[int, int, int, int]] = None
-        self._lows: Optional[Tuple[int, int, int, int]] = None
-        self._icons: Optional[Tuple[str, str, str, str]] = None
-        self._first_date: Optional[date] = None
+        """Get the forecast, from the cache if it has a fresh one."""
+        raise NotImplementedError
+
+    def _load_cached(self, stale: bool = False) -> bool:
+        if self.cache:
+            self._forecast = self.cache.get(self.cache_key, stale)
+        return self._forecast is not None
+
+    def _store(self):
+        if self.cache and self._forecast is not None:
+            self.cache.put(self.cache_key, self._forecast)
 
     @property
-    def _weather(self):
-        if not self._weather_data:
+    def forecast(self) -> Forecast:
+        if self._forecast is None:
             self.get_weather()
-        return self._weather_data
+        return cast(Forecast, self._forecast)
 
     @property
-    @abstractmethod
-    def highs(self) -> Tuple[str, str, str, str]:
-        raise NotImplementedError
+    def highs(self) -> Tuple[str, ...]:
+        return tuple(
+            format_temperature(high, self.metric) for high in self.forecast.highs
+        )
 
     @property
-    @abstractmethod
-    def lows(self) -> Tuple[str, str, str, str]:
-        raise NotImplementedError
+    def lows(self) -> Tuple[str, ...]:
+        return tuple(
+            format_temperature(low, self.metric) for low in self.forecast.lows
+        )
 
     @property
-    @abstractmethod
-    def icons(self) -> Tuple[str, str, str, str]:
-        raise NotImplementedError
+    def winds(self) -> Tuple[str, ...]:
+        return tuple(
+            format_wind(speed, direction, self.metric)
+            for speed, direction in zip(
+                self.forecast.wind_speeds, self.forecast.wind_directions
+            )
+        )
+
+    @property
+    def icons(self) -> Tuple[str, ...]:
+        return self.forecast.icons
 
     @property
-    @abstractmethod
     def first_date(self) -> date:
-        raise NotImplementedError
+        return self.forecast.first_date
 
     def fill_template(self, template: Template, rotated: bool = False) -> str:
-        substitutions: Dict[str, str] = {
+        return template.substitute(
+            self.base_substitutions(rotated), **self.forecast_substitutions()
+        )
+
+    def base_substitutions(self, rotated: bool = False) -> Dict[str, str]:
+        """The template substitutions that don't depend on the forecast."""
+        return {
             "ROTATION": "180" if rotated else "0",
-            "DATE": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+            "DATE": self.updated,
             "UNIT": "C" if self.metric else "F",
         }
+
+    def forecast_substitutions(self) -> Dict[str, str]:
+        """The template substitutions that come from the forecast."""
+        substitutions: Dict[str, str] = {}
+        forecast = self.forecast
+        # the provider's own text may contain characters special to SVG
+        substitutions["HEADLINE"] = escape(forecast.headline)
+        first_weekday = self.first_date.weekday()
         for i, number, high, low, icon in zip(
             count(), self.NUMBERS, self.highs, self.lows, self.icons
         ):
-            substitutions[f"DAY_{number}"] = (
-                self.first_date + timedelta(days=i)
-            ).strftime("%A")
+            substitutions[f"DAY_{number}"] = self.day_names[(first_weekday + i) % 7]
             substitutions[f"HIGH_{number}"] = high
             substitutions[f"LOW_{number}"] = low
             substitutions[f"ICON_{number}"] = icon
+            substitutions[f"POP_{number}"] = _nth(forecast.pops, i)
+            substitutions[f"WIND_{number}"] = _nth(self.winds, i)
+            substitutions[f"SUMMARY_{number}"] = escape(_nth(forecast.summaries, i))
+
+        return substitutions
+
+    def display_fields(self) -> Dict[str, List[str]]:
+        """The values shown on the screen, as columns by field.
+
+        Besides the forecast, this includes the time in the footer, so that an
+        update that only moves the time on still redraws the footer.
+        """
+        first_weekday = self.first_date.weekday()
+        days = range(len(self.highs))
+        return {
+            "day": [self.day_names[(first_weekday + i) % 7] for i in days],
+            "date": [(self.first_date + timedelta(days=i)).isoformat() for i in days],
+            "high": list(self.highs),
+            "low": list(self.lows),
+            "icon": list(self.icons),
+            "pop": list(self.forecast.pops),
+            "wind": list(self.winds),
+            "summary": list(self.forecast.summaries),
+            "updated": [self.updated],
+        }
 
-        return template.substitute(substitutions)
 
+class ProviderGetter(WeatherGetter):
+    """Base class for getters that download from a single weather provider.
 
-class WeatherGovGetter(WeatherGetter):
-    ZIP_URL = "https://graphical.weather.gov/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php?zipCodeList={zip_}&format=24+hourly&numDays=4&Unit=e"
-    LATLON_URL = "https://graphical.weather.gov/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php?lat={lat}&lon={lon}&format=24+hourly&numDays=4&Unit=e"
+    Providers are declarations: a URL template, a response format, and
+    precompiled paths for the header values and per-day columns they need. For
+    JSON providers, `FIELDS` are relative to each element found by `ROWS`; for
+    XML providers, each field collects every match in document order. The shared
+    engine fetches the response and extracts every field in a single pass.
 
-    def __init__(self, location: Union[ZipCode, LatLon], *args, **kwargs):
-        self._weather_data: Optional[ET.ElementTree] = None
+    Columns used by the engine are ``dates`` (optional, rows are sorted by it),
+    ``highs``, ``lows`` and ``icons``, and optionally ``pops`` (probability of
+    precipitation), ``wind_speeds``, ``wind_directions`` and ``summaries``;
+    temperatures are in `TEMPERATURE_UNIT` and wind speeds in km/h. The ``date``
+    header is used for the first day when there is no ``dates`` column, and the
+    ``headline`` header is optional.
 
-        super().__init__(location, *args, **kwargs)
+    An XML response covering several locations is split by `XML_SCOPE`, the tag
+    and attribute of the element holding each location's data.
+    """
 
-    def get_weather(self):
-        if isinstance(self.location, LatLon):
-            forecast_request = urllib.request.Request(
-                self.LATLON_URL.format(lat=self.location.lat, lon=self.location.lon)
-            )
-        else:
-            forecast_request = urllib.request.Request(
-                self.ZIP_URL.format(zip_=self.location)
-            )
+    BASE_URL: str
+    URL: str
+    FORMAT: ResponseFormat
+    ROWS: Optional[JSONPath] = None
+    HEADER: Dict[str, ExtractionPath] = {}
+    FIELDS: Dict[str, ExtractionPath] = {}
+    ICONS: IconTable
+    TEMPERATURE_UNIT = "C"
+    XML_SCOPE: Optional[Tuple[str, str]] = None
+
+    _xml_index: Dict[str, List[Tuple[bool, str, XMLPath]]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # index the XML paths by their innermost tag so each element is checked
+        # against only the paths that could possibly match it
+        index: Dict[str, List[Tuple[bool, str, XMLPath]]] = {}
+        for is_header, paths in ((True, cls.HEADER), (False, cls.FIELDS)):
+            for name, path in paths.items():
+                if isinstance(path, XMLPath):
+                    index.setdefault(path.tag, []).append((is_header, name, path))
+        cls._xml_index = index
 
-        try:
-            with closing(
-                urllib.request.urlopen(forecast_request, context=SSL_CONTEXT)
-            ) as weather_resp:
-                resp_code = weather_resp.getcode()
-                if resp_code // 100 != 2:
-                    die(
-                        Sysexits.EX_UNAVAILABLE,
-                        "Failed to retrieve weather data: %u %s",
-                        resp_code,
-                        weather_resp.reason,
-                    )
-                self._weather_data = ET.parse(weather_resp)
-        except URLError as e:
+    @abstractmethod
+    def _url_parameters(self) -> Dict[str, object]:
+        raise NotImplementedError
+
+    @property
+    def url(self) -> str:
+        return (self.BASE_URL + self.URL).format(**self._url_parameters())
+
+    def get_weather(self):
+        if self._load_cached():
+            return
+        if self.health is not None and not self.health.allow(self.NAME):
+            if self._load_cached(stale=True):
+                return
             die(
                 Sysexits.EX_UNAVAILABLE,
-                "Failed to retrieve weather data: %u %s",
-                e.code,
-                e.reason,
+                "Not trying %s until %s after repeated failures",
+                self.NAME,
+                self.health.retry_time(self.NAME).isoformat(timespec="minutes"),
             )
+        try:
+            with METRICS.time("weather_fetch_seconds", provider=self.NAME):
+                with open_url(self.url, self.timeout) as weather_resp:
+                    self._forecast = self._extract(weather_resp)
+        except SystemExit as e:
+            METRICS.inc("weather_fetches_total", provider=self.NAME, result="failed")
+            if e.code not in PROVIDER_FAILURES:
+                raise
+            if self.health is not None:
+                self.health.record_failure(self.NAME)
+            if self._load_cached(stale=True):
+                return
+            raise
+        METRICS.inc("weather_fetches_total", provider=self.NAME, result="ok")
+        if self.health is not None:
+            self.health.record_success(self.NAME)
+        self._store()
+
+    def _extract(self, source: BinaryIO) -> Forecast:
+        forecasts = self._extract_all(source)
+        if not forecasts:
+            die(Sysexits.EX_DATAERR, "No forecast in weather data")
+        return next(iter(forecasts.values()))
+
+    def _extract_all(self, source: BinaryIO) -> Dict[Optional[str], Forecast]:
+        """Extract the forecast for every location in a response.
+
+        :param source: The response to read
+
+        :returns: The forecasts, in document order, keyed by the `XML_SCOPE`
+            attribute (or ``None`` for a single-location response)
+        """
+        try:
+            with METRICS.time("weather_parse_seconds", provider=self.NAME):
+                if self.FORMAT is ResponseFormat.XML:
+                    header, scopes = self._extract_xml(source)
+                else:
+                    header, scopes = self._extract_json(json.load(source))
+            return {
+                key: self._build_forecast(header, columns)
+                for key, columns in scopes.items()
+            }
+        except (ET.ParseError, ValueError, LookupError, TypeError) as e:
+            die(Sysexits.EX_DATAERR, "Failed to parse weather data: %s", e)
+
+    def _extract_xml(
+        self, source: BinaryIO
+    ) -> Tuple[Dict, Dict[Optional[str], Dict[str, List]]]:
+        header: Dict[str, Optional[str]] = {}
+        scopes: Dict[Optional[str], Dict[str, List]] = {}
+        columns: Optional[Dict[str, List]] = None
+        scope_tag, scope_attr = self.XML_SCOPE or (None, "")
+
+        stack: List[ET.Element] = []
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                if elem.tag == scope_tag:
+                    columns = scopes.setdefault(
+                        elem.get(scope_attr), {name: [] for name in self.FIELDS}
+                    )
+                continue
+            for is_header, name, path in self._xml_index.get(elem.tag, ()):
+                if not path.matches(stack):
+                    continue
+                if is_header:
+                    header.setdefault(name, path.value(elem))
+                    continue
+                if columns is None:
+                    columns = scopes.setdefault(
+                        None, {name: [] for name in self.FIELDS}
+                    )
+                columns[name].append(path.value(elem))
+            if elem.tag == scope_tag:
+                columns = None
+            # everything needed from the element has been taken, so drop it
+            # rather than build up the whole document
+            stack.pop()
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+
+        return header, scopes
+
+    def _extract_json(
+        self, data
+    ) -> Tuple[Dict, Dict[Optional[str], Dict[str, List]]]:
+        header = {
+            name: cast(JSONPath, path).first(data) for name, path in self.HEADER.items()
+        }
+        columns: Dict[str, List] = {name: [] for name in self.FIELDS}
+
+        rows = self.ROWS.find(data) if self.ROWS else []
+        fields = [(name, cast(JSONPath, path)) for name, path in self.FIELDS.items()]
+        for row in rows:
+            for name, path in fields:
+                columns[name].append(path.first(row))
+
+        return header, {None: columns}
+
+    def _build_forecast(self, header: Dict, columns: Dict[str, List]) -> Forecast:
+        dates = columns.get("dates")
+        if dates:
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            columns = {
+                name: [values[i] for i in order if i < len(values)]
+                for name, values in columns.items()
+            }
+            first_date = columns["dates"][0]
+        else:
+            first_date = header["date"]
+
+        self._fixup(header, columns)
+        days = len(self.NUMBERS)
+        columns = {name: values[:days] for name, values in columns.items()}
+
+        return Forecast(
+            first_date=date.fromisoformat(first_date[:10]),
+            highs=tuple(self._temperature(value) for value in columns["highs"]),
+            lows=tuple(self._temperature(value) for value in columns["lows"]),
+            icons=self.ICONS.normalize(columns["icons"]),
+            pops=tuple(self._number(value) for value in columns.get("pops", ())),
+            wind_speeds=tuple(
+                self._float(value) for value in columns.get("wind_speeds", ())
+            ),
+            wind_directions=tuple(
+                value or "" for value in columns.get("wind_directions", ())
+            ),
+            summaries=tuple(value or "" for value in columns.get("summaries", ())),
+            headline=header.get("headline") or "",
+        )
 
-        super().get_weather()
+    def _fixup(self, header: Dict, columns: Dict[str, List]):
+        """Hook for correcting provider quirks in the extracted columns."""
+
+    def _temperature(self, value) -> Optional[float]:
+        temperature = self._float(value)
+        if temperature is not None and self.TEMPERATURE_UNIT == "F":
+            temperature = round((temperature - 32) / 1.8, 2)
+        return temperature
+
+    @staticmethod
+    def _float(value) -> Optional[float]:
+        if value is None or value == "":
+            return None
+        return float(value)
+
+    @staticmethod
+    def _number(value) -> str:
+        if value is None or value == "":
+            return ""
+        return str(int(float(value)))
+
+
+@register("weather.gov")
+class WeatherGovGetter(ProviderGetter):
+    BASE_URL = "https://graphical.weather.gov"
+    ZIP_URL = "/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php?zipCodeList={zip_}&format=24+hourly&numDays=4&Unit=e"
+    LATLON_URL = "/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php?lat={lat}&lon={lon}&format=24+hourly&numDays=4&Unit=e"
+    LATLON_LIST_URL = "/xml/sample_products/browser_interface/ndfdBrowserClientByDay.php?listLatLon={points}&format=24+hourly&numDays=4&Unit=e"
+    FORMAT = ResponseFormat.XML
+    TEMPERATURE_UNIT = "F"
+    XML_SCOPE = ("parameters", "applicable-location")
+
+    # the most locations to ask for in one request
+    BATCH_SIZE = 50
+    # spacing of the NDFD grid, and the length of a degree of latitude
+    GRID_KM = 2.539703
+    DEGREE_KM = 111.32
+    LOCATION_KEY_RE = re.compile(r"(?P<index>[0-9]+)$")
+
+    HEADER = {"date": XMLPath("start-valid-time")}
+    FIELDS = {
+        "highs": XMLPath("temperature[@type='maximum']/value"),
+        "lows": XMLPath("temperature[@type='minimum']/value"),
+        "icons": XMLPath("icon-link"),
+        "pops": XMLPath("probability-of-precipitation/value"),
+        "summaries": XMLPath("weather-conditions/@weather-summary"),
+    }
+    ICONS = NDFDIconTable()
 
-    @property
-    def highs(self):
-        if not self._highs:
-            self._highs = tuple(
-                elem.text
-                for elem in self._weather.findall(
-                    ".//temperature[@type='maximum']/value"
-                )
-            )
-        return self._highs
+    def __init__(self, location: Union[ZipCode, LatLon], *args, **kwargs):
+        super().__init__(location, *args, **kwargs)
 
-    @property
-    def lows(self):
-        if not self._lows:
-            self._lows = tuple(
-                elem.text
-                for elem in self._weather.findall(
-                    ".//temperature[@type='minimum']/value"
-                )
-            )
-        return self._lows
+    @classmethod
+    def snap(cls, location):
+        # approximate the NDFD grid with cells of the same size in latitude and
+        # longitude. These cells don't line up with NDFD's Lambert conformal
+        # grid, so two points in one cell may still lie in different NDFD cells
+        # and get slightly different forecasts. The point sent to the provider
+        # is the center of the cell, at most half a diagonal, about 1.8 km, from
+        # the display's own location
+        if not isinstance(location, LatLon):
+            return location
+        lat_step = cls.GRID_KM / cls.DEGREE_KM
+        lat = round(round(location.lat / lat_step) * lat_step, 4)
+        lon_step = lat_step / max(math.cos(math.radians(lat)), 0.01)
+        lon = round(round(location.lon / lon_step) * lon_step, 4)
+        return LatLon(lat, lon)
 
     @property
-    def icons(self):
-        if not self._icons:
-            self._icons = tuple(
-                PurePosixPath(urllib.parse.urlsplit(elem.text).path).stem.rstrip(
-                    "0123456789"
-                )
-                if elem.text else ""
-                for elem in self._weather.findall(".//icon-link")
-            )
-        return self._icons
+    def URL(self) -> str:  # type: ignore
+        return self.LATLON_URL if isinstance(self.location, LatLon) else self.ZIP_URL
 
-    @property
-    def first_date(self):
-        if not self._first_date:
-            self._first_date = date.fromisoformat(
-                self._weather.findall(".//start-valid-time")[0].text.split("T")[0]
-            )
-        return self._first_date
-
-
-class AccuWeatherGetter(WeatherGetter):
-    AU_FORECAST_URL = "https://dataservice.accuweather.com/forecasts/v1/daily/5day/{location_key}?apikey={api_key}&metric={metric}"
-
-    _icon_mapping: Dict[int, str] = {
-        1: "skc",  # sunny
-        2: "few",  # mostly sunny
-        3: "sct",  # partly sunny
-        4: "sct",  # intermittent clouds
-        5: "few",  # hazy sunshine
-        6: "sct",  # mostly cloudy
-        7: "ovc",  # cloudy
-        8: "ovc",  # dreary (overcast)
-        11: "fg",  # fog
-        12: "shra",  # showers
-        13: "shra",  # mostly cloudy w/ showers
-        14: "hi_shwrs",  # partly sunny w/ showers
-        15: "tsra",  # t-storms
-        16: "tsra",  # mostly cloudy w/ t-storms
-        17: "tsra",  # partly sunny w/ t-storms
-        18: "ra",  # rain
-        19: "sn",  # flurries
-        20: "sn",  # mostly cloudy w/ flurries
-        21: "sn",  # partly sunny w/ flurries
-        22: "blizzard",  # snow
-        23: "sn",  # mostly cloudy w/ snow
-        24: "ip",  # ice
-        25: "fzra",  # sleet
-        26: "fzra",  # freezing rain
-        29: "mix",  # rain and snow
-        30: "hot",  # hot
-        31: "cold",  # cold
-        32: "wind",  # windy
-        33: "skc",  # clear
-        34: "few",  # mostly clear
-        35: "sct",  # partly cloudy
-        36: "sct",  # intermittent clouds
-        37: "few",  # hazy moonlight
-        38: "sct",  # mostly cloudy
-        39: "hi_shwrs",  # partly cloudy w/ showers
-        40: "shra",  # mostly cloudy w/ showers
-        41: "tsra",  # partly cloudy w/ t-storms
-        42: "tsra",  # mostly cloudy w/ t-storms
-        43: "sn",  # mostly cloudy w/ flurries
-        44: "sn",  # mostly cloudy w/ snow
+    def _url_parameters(self):
+        if isinstance(self.location, LatLon):
+            return {"lat": self.location.lat, "lon": self.location.lon}
+        return {"zip_": self.location}
+
+    @classmethod
+    def get_weather_batch(
+        cls, getters: Sequence["WeatherGovGetter"], timeout: float = DEFAULT_TIMEOUT
+    ) -> List["WeatherGovGetter"]:
+        """Get the weather for many getters with a few multi-point requests.
+
+        Each request covers up to `BATCH_SIZE` ZIP codes or points. The response
+        is split by location key and each forecast is handed to its getters as if
+        they had fetched it themselves; a getter whose location is missing from
+        the response fetches it on its own when its forecast is next used.
+
+        If a request fails, the failure is recorded once and no more requests
+        are made: every getter still without a forecast falls back to a stale
+        one instead of trying the provider again on its own.
+
+        :param getters: The getters to get the weather for
+        :param timeout: Seconds to wait for the connection and for each read
+
+        :returns: The getters left without a forecast by a failed request
+        """
+        by_location: Dict[Location, List[WeatherGovGetter]] = {}
+        for getter in getters:
+            if not getter._load_cached():
+                by_location.setdefault(getter.location, []).append(getter)
+        health = getters[0].health if getters else None
+        if health is not None and not health.allow(cls.NAME):
+            # each getter falls back to what it has when its forecast is used
+            return []
+
+        zips = [loc for loc in by_location if not isinstance(loc, LatLon)]
+        points = [loc for loc in by_location if isinstance(loc, LatLon)]
+        for locations, url, parameter, joiner in (
+            (zips, cls.ZIP_URL, "zip_", lambda zip_: zip_),
+            (points, cls.LATLON_LIST_URL, "points", lambda p: f"{p.lat},{p.lon}"),
+        ):
+            for start in range(0, len(locations), cls.BATCH_SIZE):
+                batch = locations[start : start + cls.BATCH_SIZE]
+                batch_url = (cls.BASE_URL + url).format(
+                    **{parameter: "+".join(map(joiner, batch))}
+                )
+                logger.info("Weather.gov: %u locations in one request", len(batch))
+                try:
+                    with METRICS.time("weather_fetch_seconds", provider=cls.NAME):
+                        with open_url(batch_url, timeout) as weather_resp:
+                            first = by_location[batch[0]][0]
+                            forecasts = first._extract_all(weather_resp)
+                except SystemExit as e:
+                    METRICS.inc(
+                        "weather_fetches_total", provider=cls.NAME, result="failed"
+                    )
+                    if e.code not in PROVIDER_FAILURES:
+                        raise
+                    if health is not None:
+                        health.record_failure(cls.NAME)
+                    return [
+                        getter
+                        for location_getters in by_location.values()
+                        for getter in location_getters
+                        if getter._forecast is None
+                        and not getter._load_cached(stale=True)
+                    ]
+                METRICS.inc("weather_fetches_total", provider=cls.NAME, result="ok")
+                if health is not None:
+                    health.record_success(cls.NAME)
+
+                for key, forecast in forecasts.items():
+                    # location keys are "point1", "point2", ... in request order
+                    match = cls.LOCATION_KEY_RE.search(key or "")
+                    index = int(match.group("index")) - 1 if match else 0
+                    if not 0 <= index < len(batch):
+                        logger.warning("Unexpected location key: %s", key)
+                        continue
+                    for getter in by_location[batch[index]]:
+                        getter._forecast = forecast
+                    by_location[batch[index]][0]._store()
+        return []
+
+    def _fixup(self, header, columns):
+        # precipitation chances are given for 12 hour periods, so take the
+        # larger of each day's pair
+        pops = columns["pops"]
+        columns["pops"] = [
+            max((int(pop) for pop in pops[i : i + 2] if pop), default=None)
+            for i in range(0, len(pops), 2)
+        ]
+
+
+@register("accuweather")
+class AccuWeatherGetter(ProviderGetter):
+    BASE_URL = "https://dataservice.accuweather.com"
+    URL = "/forecasts/v1/daily/5day/{location_key}?apikey={api_key}&metric=true&details=true"
+    FORMAT = ResponseFormat.JSON
+
+    ROWS = JSONPath("DailyForecasts.*")
+    HEADER = {
+        "date": JSONPath("Headline.EffectiveDate"),
+        "headline": JSONPath("Headline.Text"),
     }
+    FIELDS = {
+        "dates": JSONPath("Date"),
+        "highs": JSONPath("Temperature.Maximum.Value"),
+        "lows": JSONPath("Temperature.Minimum.Value"),
+        "icons": JSONPath("Day.Icon"),
+        "pops": JSONPath("Day.PrecipitationProbability"),
+        "wind_speeds": JSONPath("Day.Wind.Speed.Value"),
+        "wind_directions": JSONPath("Day.Wind.Direction.Localized"),
+        "summaries": JSONPath("Day.IconPhrase"),
+    }
+    ICONS = IconTable(
+        {
+            1: "skc",  # sunny
+            2: "few",  # mostly sunny
+            3: "sct",  # partly sunny
+            4: "sct",  # intermittent clouds
+            5: "few",  # hazy sunshine
+            6: "sct",  # mostly cloudy
+            7: "ovc",  # cloudy
+            8: "ovc",  # dreary (overcast)
+            11: "fg",  # fog
+            12: "shra",  # showers
+            13: "shra",  # mostly cloudy w/ showers
+            14: "hi_shwrs",  # partly sunny w/ showers
+            15: "tsra",  # t-storms
+            16: "tsra",  # mostly cloudy w/ t-storms
+            17: "tsra",  # partly sunny w/ t-storms
+            18: "ra",  # rain
+            19: "sn",  # flurries
+            20: "sn",  # mostly cloudy w/ flurries
+            21: "sn",  # partly sunny w/ flurries
+            22: "blizzard",  # snow
+            23: "sn",  # mostly cloudy w/ snow
+            24: "ip",  # ice
+            25: "fzra",  # sleet
+            26: "fzra",  # freezing rain
+            29: "mix",  # rain and snow
+            30: "hot",  # hot
+            31: "cold",  # cold
+            32: "wind",  # windy
+            33: "skc",  # clear
+            34: "few",  # mostly clear
+            35: "sct",  # partly cloudy
+            36: "sct",  # intermittent clouds
+            37: "few",  # hazy moonlight
+            38: "sct",  # mostly cloudy
+            39: "hi_shwrs",  # partly cloudy w/ showers
+            40: "shra",  # mostly cloudy w/ showers
+            41: "tsra",  # partly cloudy w/ t-storms
+            42: "tsra",  # mostly cloudy w/ t-storms
+            43: "sn",  # mostly cloudy w/ flurries
+            44: "sn",  # mostly cloudy w/ snow
+        }
+    )
 
     def __init__(self, api_key: str, location: LocationKey, *args, **kwargs):
         self.api_key = api_key
 
-        self._weather_data: Optional[Dict] = None
-        self._sorted_forecasts_storage: Optional[List] = None
+        super().__init__(location, *args, **kwargs)
+
+    def _url_parameters(self):
+        return {
+            "location_key": self.location,
+            "api_key": self.api_key,
+        }
+
+
+@register("wmo")
+class WMOGetter(ProviderGetter):
+    BASE_URL = "https://worldweather.wmo.int"
+    URL = "/en/json/{city_id}_en.json"
+    FORMAT = ResponseFormat.JSON
+
+    ROWS = JSONPath("city.forecast.forecastDay.*")
+    FIELDS = {
+        "dates": JSONPath("forecastDate"),
+        "highs": JSONPath("maxTemp"),
+        "lows": JSONPath("minTemp"),
+        "icons": JSONPath("weatherIcon"),
+        "summaries": JSONPath("weather"),
+    }
+    ICONS = IconTable(
+        {
+            101: "du",  # sandstorm
+            102: "du",  # duststorm
+            103: "du",  # sand
+            104: "du",  # dust
+            201: "tsra",  # thunderstorms
+            202: "tsra",  # thundershowers
+            203: "tsra",  # storm
+            204: "scttsra",  # lightning
+            301: "ip",  # hail
+            401: "sn",  # blowing snow
+            402: "blizzard",  # blizzard
+            403: "sn",  # snowdrift
+            404: "blizzard",  # snowstorm
+            501: "sn",  # snow showers
+            502: "sn",  # flurries
+            601: "sn",  # snow
+            602: "sn",  # heavy snow
+            603: "sn",  # snowfall
+            701: "sn",  # light snow
+            801: "fzra",  # sleet
+            901: "shra",  # showers
+            902: "shra",  # heavy showers
+            903: "shra",  # rainshower
+            1001: "hi_shwrs",  # occasional showers
+            1002: "hi_shwrs",  # scattered showers
+            1101: "hi_shwrs",  # isolated showers
+            1201: "shra",  # light showers
+            1301: "fzra",  # freezing rain
+            1401: "ra",  # rain
+            1501: "ra",  # drizzle
+            1502: "ra",  # light rain
+            1601: "fg",  # fog
+            1701: "fg",  # mist
+            1801: "fu",  # smoke
+            1901: "fg",  # haze
+            2001: "ovc",  # overcast
+            2101: "bkn",  # sunny intervals
+            2102: "bkn",  # no rain
+            2103: "few",  # clearing
+            2201: "sct",  # sunny periods
+            2202: "sct",  # partly cloudy
+            2203: "sct",  # partly bright
+            2204: "sct",  # mild
+            2301: "ovc",  # cloudy
+            2302: "bkn",  # mostly cloudy
+            2401: "skc",  # bright
+            2402: "skc",  # sunny
+            2403: "skc",  # fair
+            2501: "skc",  # fine
+            2502: "skc",  # clear
+            2601: "wind",  # windy
+            2602: "wind",  # squall
+            2603: "wind",  # stormy
+            2604: "wind",  # gale
+            2701: "ra",  # wet
+            2702: "hot",  # humid
+            2801: "hot",  # dry
+            2901: "cold",  # freezing
+            3001: "cold",  # frost
+            3101: "hot",  # hot
+            3201: "cold",  # cold
+            3202: "cold",  # chilly
+            3301: "hot",  # warm
+            3401: "cold",  # cool
+            3501: "fu",  # volcanic ash
+        }
+    )
 
+    def __init__(self, location: CityID, *args, **kwargs):
         super().__init__(location, *args, **kwargs)
 
+    def _url_parameters(self):
+        return {"city_id": self.location}
+
+    def _fixup(self, header, columns):
+        # WMO doesn't provide a low for the day once the night is over, so fix that up
+        if len(columns["lows"]) > 1 and not columns["lows"][0]:
+            columns["lows"][0] = columns["lows"][1]
+
+
+class ConsensusGetter(WeatherGetter):
+    """Merge the forecasts of several providers for one place.
+
+    Every provider is asked at once, each in its own thread, and what has
+    arrived within `timeout` (the slowest a provider is allowed to be) is merged
+    day by day, on the days of the first provider to answer in the order given.
+    Under the ``median`` policy, temperatures, wind speeds and precipitation
+    chances are the median of the providers' and the icon is the most common
+    one; under ``priority``, every value comes from the first provider that has
+    it. Text always comes by priority. The merged forecast is cached like any
+    other, and how far each provider is from it is recorded in `METRICS`.
+    """
+
+    NAME = "consensus"
+    POLICIES = ("median", "priority")
+    NUMERIC_FIELDS = ("highs", "lows", "wind_speeds")
+    TEXT_FIELDS = ("wind_directions", "summaries")
+
+    def __init__(
+        self, getters: Sequence[WeatherGetter], policy: str = "median", *args, **kwargs
+    ):
+        self.getters = list(getters)
+        self.policy = policy
+        location = "+".join(getter.cache_key for getter in self.getters)
+        super().__init__(cast(LocationKey, f"{policy}:{location}"), *args, **kwargs)
+
     def get_weather(self):
-        forecast_request = urllib.request.Request(
-            self.AU_FORECAST_URL.format(
-                location_key=self.location,
-                api_key=self.api_key,
-                metric=str(self.metric).lower(),
-            )
+        if self._load_cached():
+            return
+        deadline = time.monotonic() + self.timeout
+        fetches = [BackgroundFetch(getter) for getter in self.getters]
+        forecasts: List[Tuple[str, Forecast]] = []
+        for fetch in fetches:
+            name = fetch.getter.NAME
+            fetch.thread.join(max(deadline - time.monotonic(), 0))
+            if fetch.thread.is_alive():
+                logger.warning("Leaving %s out of the consensus: too slow", name)
+                METRICS.inc("weather_consensus_left_out_total", provider=name)
+                continue
+            try:
+                forecasts.append((name, fetch.wait().forecast))
+            except SystemExit:
+                # the failure has already been logged
+                logger.warning("Leaving %s out of the consensus", name)
+                METRICS.inc("weather_consensus_left_out_total", provider=name)
+        if not forecasts:
+            die(Sysexits.EX_UNAVAILABLE, "No provider had a forecast")
+
+        self._forecast = self.merge([forecast for _, forecast in forecasts])
+        for name, forecast in forecasts:
+            self._record_disagreement(name, forecast, self._forecast)
+        self._store()
+
+    @staticmethod
+    def _on_day(forecast: Forecast, field: str, day: date):
+        values = getattr(forecast, field)
+        index = (day - forecast.first_date).days
+        return values[index] if 0 <= index < len(values) else None
+
+    def merge(self, forecasts: Sequence[Forecast]) -> Forecast:
+        """Merge forecasts according to `policy`, in order of priority."""
+        first_date = forecasts[0].first_date
+        days = [first_date + timedelta(days=i) for i in range(len(forecasts[0].highs))]
+
+        def candidates(field: str, day: date) -> List:
+            values = (self._on_day(forecast, field, day) for forecast in forecasts)
+            return [value for value in values if value not in (None, "", ICON_FALLBACK)]
+
+        def number(field: str, day: date) -> Optional[float]:
+            values = candidates(field, day)
+            if not values:
+                return None
+            return statistics.median(values) if self.policy == "median" else values[0]
+
+        def pop(day: date) -> str:
+            values = [int(value) for value in candidates("pops", day)]
+            if not values:
+                return ""
+            if self.policy != "median":
+                return str(values[0])
+            return str(math.floor(statistics.median(values) + 0.5))
+
+        def icon(day: date) -> str:
+            values = candidates("icons", day)
+            if not values:
+                return ICON_FALLBACK
+            if self.policy != "median":
+                return values[0]
+            # the most common, and the earliest of those that are as common
+            return max(values, key=values.count)
+
+        def text(field: str, day: date) -> str:
+            values = candidates(field, day)
+            return values[0] if values else ""
+
+        numbers = {
+            field: tuple(number(field, day) for day in days)
+            for field in self.NUMERIC_FIELDS
+        }
+        texts = {
+            field: tuple(text(field, day) for day in days) for field in self.TEXT_FIELDS
+        }
+        return Forecast(
+            first_date=first_date,
+            icons=tuple(icon(day) for day in days),
+            pops=tuple(pop(day) for day in days),
+            headline=next(
+                (forecast.headline for forecast in forecasts if forecast.headline), ""
+            ),
+            highs=numbers["highs"],
+            lows=numbers["lows"],
+            wind_speeds=numbers["wind_speeds"],
+            wind_directions=texts["wind_directions"],
+            summaries=texts["summaries"],
         )
+
+    def _record_disagreement(self, name: str, forecast: Forecast, merged: Forecast):
+        for i, (high, low, icon) in enumerate(
+            zip(merged.highs, merged.lows, merged.icons)
+        ):
+            day = merged.first_date + timedelta(days=i)
+            for field, consensus in (("highs", high), ("lows", low)):
+                value = self._on_day(forecast, field, day)
+                if value is None or consensus is None:
+                    continue
+                METRICS.inc(
+                    "weather_consensus_deviation_degrees_total",
+                    abs(value - consensus),
+                    provider=name,
+                )
+                METRICS.inc("weather_consensus_temperatures_total", provider=name)
+            if self._on_day(forecast, "icons", day) not in (None, ICON_FALLBACK, icon):
+                METRICS.inc("weather_consensus_icon_disagreements_total", provider=name)
+
+
+class Refresh(enum.Enum):
+    """How much of the screen a change of forecast needs redrawn."""
+
+    NONE = "none"
+    FOOTER = "footer"
+    TEXT = "text"
+    ICONS = "icons"
+    FULL = "full"
+
+
+class ForecastChange(NamedTuple):
+    day: int
+    field: str
+    old: str
+    new: str
+
+
+# fields whose change shifts every day over, so the whole screen changes
+LAYOUT_FIELDS = frozenset(["day", "date"])
+# fields that change with every update, whether or not the forecast does
+FOOTER_FIELDS = frozenset(["updated"])
+
+
+def diff_forecasts(
+    previous: Mapping[str, Sequence[str]], current: Mapping[str, Sequence[str]]
+) -> List[ForecastChange]:
+    """Compare the displayed fields of two forecasts, day by day.
+
+    :param previous: The fields of the forecast on the screen, as returned by
+        `WeatherGetter.display_fields`
+    :param current: The fields of the new forecast
+
+    :returns: Every field of every day that differs, in field then day order
+    """
+    changes = []
+    for field in sorted(set(previous) | set(current)):
+        old = previous.get(field, ())
+        new = current.get(field, ())
+        for day in range(max(len(old), len(new))):
+            if _nth(old, day) != _nth(new, day):
+                changes.append(
+                    ForecastChange(day, field, _nth(old, day), _nth(new, day))
+                )
+    return changes
+
+
+def classify_changes(changes: Sequence[ForecastChange]) -> Refresh:
+    """Decide how much of the screen to refresh for a set of changes."""
+    fields = {change.field for change in changes}
+    if not fields:
+        return Refresh.NONE
+    if fields <= FOOTER_FIELDS:
+        return Refresh.FOOTER
+    if fields & LAYOUT_FIELDS:
+        return Refresh.FULL
+    if "icon" in fields:
+        return Refresh.ICONS
+    return Refresh.TEXT
+
+
+def record_changes(path: Path, weather_getter: WeatherGetter) -> Refresh:
+    """Compare a forecast with the one recorded in a file, and record it there.
+
+    The file holds the refresh needed, the changes and the displayed fields. It
+    is compact JSON with the refresh first, so the shell can pick it out. A
+    forecast is compared with nothing, and needs a full refresh, if the file is
+    missing or unreadable.
+
+    :param path: The file the previous forecast was recorded in
+    :param weather_getter: The getter with the new forecast
+
+    :returns: How much of the screen to refresh
+    """
+    current = weather_getter.display_fields()
+    try:
+        with path.open() as f:
+            previous = json.load(f)["fields"]
+        changes = diff_forecasts(previous, current)
+        kind = classify_changes(changes)
+    except (OSError, ValueError, LookupError, TypeError):
+        changes = []
+        kind = Refresh.FULL
+    logger.info("Forecast changes need a %s refresh", kind.value)
+
+    record = {
+        "refresh": kind.value,
+        "changes": [list(change) for change in changes],
+        "fields": current,
+    }
+    try:
+        atomic_write(path, json.dumps(record, separators=(",", ":")).encode())
+    except OSError as e:
+        logger.warning("Failed to record the forecast in %s: %s", path, e)
+    return kind
+
+
+class Raster(NamedTuple):
+    """An 8-bit grayscale image, one byte per pixel, row by row."""
+
+    width: int
+    height: int
+    pixels: bytes
+
+
+class RsvgDimensionData(ctypes.Structure):
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("em", ctypes.c_double),
+        ("ex", ctypes.c_double),
+    ]
+
+
+class SVGRenderer:
+    """Rasterizes SVG straight to an 8-bit grayscale `Raster`.
+
+    This uses the bundled librsvg (the library behind ``rsvg-convert``) and the
+    system cairo through ctypes, so no PNG is encoded or decoded on the way to
+    the screen.
+    """
+
+    # bundled libraries, in dependency order
+    LIBRARIES = [
+        "libpng14.so.14",
+        "libxml2.so.2",
+        "libcroco-0.6.so.3",
+        "libgsf-1.so.114",
+        "librsvg-2.so.2",
+    ]
+    CAIRO_FORMAT_RGB24 = 1
+
+    def __init__(self, lib_dir: Path = HERE / Path("../lib")):
         try:
-            with closing(
-                urllib.request.urlopen(forecast_request, context=SSL_CONTEXT)
-            ) as weather_resp:
-                resp_code = weather_resp.getcode()
-                if resp_code // 100 != 2:
-                    die(
-                        Sysexits.EX_UNAVAILABLE,
-                        "Failed to retrieve weather data: %u %s",
-                        resp_code,
-                        weather_resp.reason,
-                    )
-                weather_data = json.load(weather_resp)
-                self._weather_data = weather_data
-        except URLError as e:
-            die(
-                Sysexits.EX_UNAVAILABLE,
-                "Failed to retrieve weather data: %u %s",
-                e.code,
-                e.reason,
+            for name in self.LIBRARIES:
+                library = ctypes.CDLL(
+                    str((lib_dir / name).resolve()), mode=ctypes.RTLD_GLOBAL
+                )
+            self.rsvg = library
+            self.cairo = ctypes.CDLL(
+                ctypes.util.find_library("cairo") or "libcairo.so.2"
             )
+            self.gobject = ctypes.CDLL(
+                ctypes.util.find_library("gobject-2.0") or "libgobject-2.0.so.0"
+            )
+        except OSError as e:
+            die(Sysexits.EX_OSFILE, "Failed to load the SVG renderer: %s", e)
+
+        void_p = ctypes.c_void_p
+        self.rsvg.rsvg_handle_new.restype = void_p
+        self.rsvg.rsvg_handle_write.argtypes = [
+            void_p,
+            ctypes.c_char_p,
+            ctypes.c_size_t,
+            void_p,
+        ]
+        self.rsvg.rsvg_handle_close.argtypes = [void_p, void_p]
+        self.rsvg.rsvg_handle_new_from_data.restype = void_p
+        self.rsvg.rsvg_handle_new_from_data.argtypes = [
+            ctypes.c_char_p,
+            ctypes.c_size_t,
+            void_p,
+        ]
+        self.rsvg.rsvg_handle_get_dimensions.argtypes = [void_p, void_p]
+        self.rsvg.rsvg_handle_render_cairo.argtypes = [void_p, void_p]
+        self.cairo.cairo_image_surface_create.restype = void_p
+        self.cairo.cairo_create.restype = void_p
+        self.cairo.cairo_create.argtypes = [void_p]
+        self.cairo.cairo_set_source_rgb.argtypes = [
+            void_p,
+            ctypes.c_double,
+            ctypes.c_double,
+            ctypes.c_double,
+        ]
+        self.cairo.cairo_paint.argtypes = [void_p]
+        self.cairo.cairo_surface_flush.argtypes = [void_p]
+        self.cairo.cairo_image_surface_get_data.restype = void_p
+        self.cairo.cairo_image_surface_get_data.argtypes = [void_p]
+        self.cairo.cairo_image_surface_get_stride.argtypes = [void_p]
+        self.cairo.cairo_destroy.argtypes = [void_p]
+        self.cairo.cairo_surface_destroy.argtypes = [void_p]
+        self.gobject.g_object_unref.argtypes = [void_p]
+
+        # needed before GLib 2.36, a no-op after
+        if hasattr(self.gobject, "g_type_init"):
+            self.gobject.g_type_init()
+
+    def _load(self, svg: bytes) -> int:
+        handle = self.rsvg.rsvg_handle_new_from_data(svg, len(svg), None)
+        if not handle:
+            die(Sysexits.EX_DATAERR, "Failed to parse the filled template")
+        return handle
+
+    def _load_chunks(self, chunks: Iterable[bytes]) -> int:
+        handle = self.rsvg.rsvg_handle_new()
+        try:
+            for chunk in chunks:
+                if not self.rsvg.rsvg_handle_write(handle, chunk, len(chunk), None):
+                    die(Sysexits.EX_DATAERR, "Failed to parse the filled template")
+            if not self.rsvg.rsvg_handle_close(handle, None):
+                die(Sysexits.EX_DATAERR, "Failed to parse the filled template")
+        except BaseException:
+            self.gobject.g_object_unref(handle)
+            raise
+        return handle
+
+    def canvas(self, svg: bytes) -> Canvas:
+        """Start a drawing on a white background the size of an SVG document.
+
+        :param svg: The document to draw first
+
+        :returns: The canvas, to draw more documents on top
+        """
+        return self._canvas(self._load(svg))
+
+    def _canvas(self, handle: int) -> Canvas:
+        try:
+            dimensions = RsvgDimensionData()
+            self.rsvg.rsvg_handle_get_dimensions(handle, ctypes.byref(dimensions))
+            canvas = Canvas(self, dimensions.width, dimensions.height)
+            canvas.draw_handle(handle)
+        finally:
+            self.gobject.g_object_unref(handle)
+        return canvas
 
-        super().get_weather()
+    def render(self, svg: bytes) -> Raster:
+        """Render an SVG document onto a white background.
 
-    @property
-    def _sorted_forecasts(self):
-        if not self._sorted_forecasts_storage:
-            self._sorted_forecasts_storage = sorted(
-                self._weather["DailyForecasts"], key=itemgetter("Date")
-            )
-        return self._sorted_forecasts_storage
+        :param svg: The document to render
 
-    @property
-    def highs(self):
-        if not self._highs:
-            self._highs = tuple(
-                str(int(forecast["Temperature"]["Maximum"]["Value"]))
-                for forecast in self._sorted_forecasts
-            )
-        return self._highs
+        :returns: The rendered image
+        """
+        return self.canvas(svg).finish()
 
-    @property
-    def lows(self):
-        if not self._lows:
-            self._lows = tuple(
-                str(int(forecast["Temperature"]["Minimum"]["Value"]))
-                for forecast in self._sorted_forecasts
-            )
-        return self._lows
+    def render_chunks(self, chunks: Iterable[bytes]) -> Raster:
+        """Render an SVG document fed in pieces, never holding all of its text.
 
-    @property
-    def icons(self):
-        if not self._icons:
-            self._icons = tuple(
-                self._icon_mapping[forecast["Day"]["Icon"]]
-                for forecast in self._sorted_forecasts
-            )
-        return self._icons
+        :param chunks: The pieces of the document
 
-    @property
-    def first_date(self):
-        if not self._first_date:
-            if self._sorted_forecasts:
-                first_date = self._sorted_forecasts[0]["Date"]
-            else:
-                first_date = self._weather["Headline"]["EffectiveDate"]
-            self._first_date = datetime.fromisoformat(first_date).date()
-        return self._first_date
-
-
-class WMOGetter(WeatherGetter):
-    WMO_URL = "https://worldweather.wmo.int/en/json/{city_id}_en.json"
-
-    _icon_mapping: Dict[int, str] = {
-        101: "du",  # sandstorm
-        102: "du",  # duststorm
-        103: "du",  # sand
-        104: "du",  # dust
-        201: "tsra",  # thunderstorms
-        202: "tsra",  # thundershowers
-        203: "tsra",  # storm
-        204: "scttsra",  # lightning
-        301: "ip",  # hail
-        401: "sn",  # blowing snow
-        402: "blizzard",  # blizzard
-        403: "sn",  # snowdrift
-        404: "blizzard",  # snowstorm
-        501: "sn",  # snow showers
-        502: "sn",  # flurries
-        601: "sn",  # snow
-        602: "sn",  # heavy snow
-        603: "sn",  # snowfall
-        701: "sn",  # light snow
-        801: "fzra",  # sleet
-        901: "shra",  # showers
-        902: "shra",  # heavy showers
-        903: "shra",  # rainshower
-        1001: "hi_shwrs",  # occasional showers
-        1002: "hi_shwrs",  # scattered showers
-        1101: "hi_shwrs",  # isolated showers
-        1201: "shra",  # light showers
-        1301: "fzra",  # freezing rain
-        1401: "ra",  # rain
-        1501: "ra",  # drizzle
-        1502: "ra",  # light rain
-        1601: "fg",  # fog
-        1701: "fg",  # mist
-        1801: "fu",  # smoke
-        1901: "fg",  # haze
-        2001: "ovc",  # overcast
-        2101: "bkn",  # sunny intervals
-        2102: "bkn",  # no rain
-        2103: "few",  # clearing
-        2201: "sct",  # sunny periods
-        2202: "sct",  # partly cloudy
-        2203: "sct",  # partly bright
-        2204: "sct",  # mild
-        2301: "ovc",  # cloudy
-        2302: "bkn",  # mostly cloudy
-        2401: "skc",  # bright
-        2402: "skc",  # sunny
-        2403: "skc",  # fair
-        2501: "skc",  # fine
-        2502: "skc",  # clear
-        2601: "wind",  # windy
-        2602: "wind",  # squall
-        2603: "wind",  # stormy
-        2604: "wind",  # gale
-        2701: "ra",  # wet
-        2702: "hot",  # humid
-        2801: "hot",  # dry
-        2901: "cold",  # freezing
-        3001: "cold",  # frost
-        3101: "hot",  # hot
-        3201: "cold",  # cold
-        3202: "cold",  # chilly
-        3301: "hot",  # warm
-        3401: "cold",  # cool
-        3501: "fu",  # volcanic ash
-    }
+        :returns: The rendered image
+        """
+        return self._canvas(self._load_chunks(chunks)).finish()
 
-    def __init__(self, location: CityID, *args, **kwargs):
-        self._weather_data: Optional[Dict] = None
 
-        super().__init__(location, *args, **kwargs)
+class Canvas:
+    """A cairo surface that SVG documents are drawn onto, one over the other."""
 
-    def get_weather(self):
-        forecast_request = urllib.request.Request(
-            self.WMO_URL.format(city_id=self.location)
+    def __init__(self, renderer: SVGRenderer, width: int, height: int):
+        self.renderer = renderer
+        self.cairo = renderer.cairo
+        self.width = width
+        self.height = height
+        self.surface = self.cairo.cairo_image_surface_create(
+            renderer.CAIRO_FORMAT_RGB24, width, height
         )
+        self.context = self.cairo.cairo_create(self.surface)
+        self.cairo.cairo_set_source_rgb(self.context, 1.0, 1.0, 1.0)
+        self.cairo.cairo_paint(self.context)
+
+    def draw_handle(self, handle: int):
+        if not self.renderer.rsvg.rsvg_handle_render_cairo(handle, self.context):
+            die(Sysexits.EX_SOFTWARE, "Failed to render the filled template")
+
+    def draw(self, svg: bytes):
+        """Draw an SVG document over what is already on the canvas."""
+        handle = self.renderer._load(svg)
         try:
-            with closing(
-                urllib.request.urlopen(forecast_request, context=SSL_CONTEXT)
-            ) as weather_resp:
-                resp_code = weather_resp.getcode()
-                if resp_code // 100 != 2:
+            self.draw_handle(handle)
+        finally:
+            self.renderer.gobject.g_object_unref(handle)
+
+    def finish(self) -> Raster:
+        """Free the canvas, returning what was drawn on it."""
+        try:
+            self.cairo.cairo_surface_flush(self.surface)
+            stride = self.cairo.cairo_image_surface_get_stride(self.surface)
+            data = ctypes.string_at(
+                self.cairo.cairo_image_surface_get_data(self.surface),
+                stride * self.height,
+            )
+        finally:
+            self.cairo.cairo_destroy(self.context)
+            self.cairo.cairo_surface_destroy(self.surface)
+        return Raster(
+            self.width,
+            self.height,
+            _gray_channel(data, self.width, self.height, stride),
+        )
+
+
+def _gray_channel(data: bytes, width: int, height: int, stride: int) -> bytes:
+    """Take one byte per pixel from cairo's native-endian xRGB pixels.
+
+    Everything in the template is black, white or gray, so the green channel
+    alone is the gray level.
+    """
+    green = 1 if sys.byteorder == "little" else 2
+    if stride == width * 4:
+        return data[green::4]
+    return b"".join(
+        data[row * stride + green : row * stride + width * 4 : 4]
+        for row in range(height)
+    )
+
+
+class Framebuffer:
+    """An 8-bit grayscale framebuffer device, or a file standing in for one.
+
+    A plain file is laid out as a framebuffer exactly the size of the raster
+    written to it, which makes it easy to check the output without a Kindle.
+    """
+
+    FBIOGET_VSCREENINFO = 0x4600
+    FBIOGET_FSCREENINFO = 0x4602
+    # xres, yres, xres_virtual, yres_virtual, xoffset, yoffset, bits_per_pixel
+    VAR_SCREENINFO = struct.Struct("@7I")
+    VAR_SCREENINFO_SIZE = 160
+    # id, smem_start, smem_len, type, type_aux, visual, xpanstep, ypanstep,
+    # ywrapstep, line_length, mmio_start, mmio_len, accel, capabilities, reserved
+    FIX_SCREENINFO = struct.Struct("@16sL4I3HIL2I3H")
+
+    INVERT = bytes(range(255, -1, -1))
+
+    def __init__(self, path: str, invert: bool = False):
+        self.path = path
+        self.invert = invert
+
+    def _geometry(self, fd: int) -> Tuple[int, int, int, int, int]:
+        var = bytearray(self.VAR_SCREENINFO_SIZE)
+        fcntl.ioctl(fd, self.FBIOGET_VSCREENINFO, var)
+        fix = bytearray(self.FIX_SCREENINFO.size)
+        fcntl.ioctl(fd, self.FBIOGET_FSCREENINFO, fix)
+
+        width, height, _, _, _, yoffset, depth = self.VAR_SCREENINFO.unpack_from(var)
+        line_length = self.FIX_SCREENINFO.unpack(fix)[9]
+        return width, height, depth, line_length, yoffset * line_length
+
+    def write(self, raster: Raster):
+        """Copy a raster into the top left of the framebuffer."""
+        try:
+            with open(self.path, "r+b" if os.path.exists(self.path) else "w+b") as f:
+                if stat.S_ISCHR(os.fstat(f.fileno()).st_mode):
+                    width, height, bits_per_pixel, stride, offset = self._geometry(
+                        f.fileno()
+                    )
+                else:
+                    width, height, bits_per_pixel = raster.width, raster.height, 8
+                    stride, offset = raster.width, 0
+                    f.truncate(stride * height)
+                if bits_per_pixel != 8:
                     die(
-                        Sysexits.EX_UNAVAILABLE,
-                        "Failed to retrieve weather data: %u %s",
-                        resp_code,
-                        weather_resp.reason,
+                        Sysexits.EX_CONFIG,
+                        "Only 8-bit framebuffers are supported, not %u-bit",
+                        bits_per_pixel,
                     )
-                weather_data = json.load(weather_resp)
-                self._weather_data = weather_data
-        except URLError as e:
-            die(
-                Sysexits.EX_UNAVAILABLE,
-                "Failed to retrieve weather data: %u %s",
-                e.code,
-                e.reason,
-            )
 
-        super().get_weather()
+                rows = min(height, raster.height)
+                columns = min(width, raster.width)
+                with mmap.mmap(f.fileno(), offset + stride * rows) as fb:
+                    for y in range(rows):
+                        start = y * raster.width
+                        row = raster.pixels[start : start + columns]
+                        if self.invert:
+                            row = row.translate(self.INVERT)
+                        fb_start = offset + y * stride
+                        fb[fb_start : fb_start + columns] = row
+        except OSError as e:
+            die(Sysexits.EX_IOERR, "Failed to write to the framebuffer: %s", e)
+
+
+# 4x4 Bayer matrix: the order in which the pixels of each 4x4 tile turn white as
+# the gray level rises
+BAYER = (
+    (0, 8, 2, 10),
+    (12, 4, 14, 6),
+    (3, 11, 1, 9),
+    (15, 7, 13, 5),
+)
+# one translation table per position in the tile, mapping each gray level to
+# black or white, so that a row is dithered with four bytes.translate calls
+DITHER_TABLES = tuple(
+    tuple(
+        bytes(255 if level * 2 > rank * 32 + 16 else 0 for level in range(256))
+        for rank in row
+    )
+    for row in BAYER
+)
 
-    @property
-    def highs(self):
-        if not self._highs:
-            self._highs = tuple(
-                forecast_day["maxTemp" if self.metric else "maxTempF"]
-                for forecast_day in self._weather["city"]["forecast"]["forecastDay"][
-                    0:4
-                ]
-            )
-        return self._highs
 
-    @property
-    def lows(self):
-        if not self._lows:
-            lows = [
-                forecast_day["minTemp" if self.metric else "minTempF"]
-                for forecast_day in self._weather["city"]["forecast"]["forecastDay"][
-                    0:4
-                ]
-            ]
-            # WMO doesn't provide a low for the day once the night is over, so fix that up
-            if not lows[0]:
-                lows[0] = lows[1]
-            self._lows = tuple(lows)
-        return self._lows
+def dither(raster: Raster) -> Raster:
+    """Reduce a raster to pure black and white with ordered dithering.
 
-    @property
-    def icons(self):
-        if not self._icons:
-            self._icons = tuple(
-                self._icon_mapping[forecast_day["weatherIcon"]]
-                for forecast_day in self._weather["city"]["forecast"]["forecastDay"][
-                    0:4
-                ]
-            )
-        return self._icons
+    Black and white pixels stay as they are, so text and lines are unchanged;
+    only gray areas turn into a pattern.
 
-    @property
-    def first_date(self):
-        if not self._first_date:
-            self._first_date = date.fromisoformat(
-                self._weather["city"]["forecast"]["forecastDay"][0]["forecastDate"]
-            )
-        return self._first_date
+    :param raster: The grayscale raster
+
+    :returns: A raster of only 0 and 255 pixels
+    """
+    width = raster.width
+    pixels = bytearray(raster.pixels)
+    for y in range(raster.height):
+        start = y * width
+        row = raster.pixels[start : start + width]
+        for phase, table in enumerate(DITHER_TABLES[y % 4]):
+            pixels[start + phase : start + width : 4] = row[phase::4].translate(table)
+    return Raster(raster.width, raster.height, bytes(pixels))
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# black (0) to "0" and everything else to "1", for packing 1-bit rows
+PNG_BITS = bytes(48 if level < 128 else 49 for level in range(256))
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+def write_png(path: str, raster: Raster, bilevel: bool = False):
+    """Write a raster as a grayscale PNG without alpha, ready for eips.
+
+    :param path: The file to write to
+    :param raster: The raster to write
+    :param bilevel: Whether to write 1 bit per pixel, for a raster that is
+        only black and white
+    """
+    width = raster.width
+    rows = []
+    for y in range(raster.height):
+        row = raster.pixels[y * width : (y + 1) * width]
+        if bilevel:
+            bits = row.translate(PNG_BITS).ljust(-(-width // 8) * 8, b"0")
+            row = int(bits, 2).to_bytes(len(bits) // 8, "big")
+        # filter type 0 (none) for every row
+        rows.append(b"\x00" + row)
+
+    header = struct.pack(
+        ">2I5B", width, raster.height, 1 if bilevel else 8, 0, 0, 0, 0
+    )
+    png = b"".join(
+        [
+            PNG_SIGNATURE,
+            _png_chunk(b"IHDR", header),
+            _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 9)),
+            _png_chunk(b"IEND", b""),
+        ]
+    )
+    try:
+        atomic_write(Path(path), png)
+    except OSError as e:
+        die(Sysexits.EX_IOERR, "Failed to write the PNG: %s", e)
+
+
+class BackgroundFetch:
+    """Download a getter's forecast in a thread while other work goes on.
+
+    A failure in the thread, including a call to `die`, is raised again from
+    `wait`, so the exit code is the same as for a download in the foreground.
+    The thread is a daemon so that a time limit can end the program while it
+    is still waiting on the network.
+    """
+
+    def __init__(self, getter: WeatherGetter):
+        self.getter = getter
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.getter.get_weather()
+        except BaseException as e:
+            self.error = e
+
+    def wait(self) -> WeatherGetter:
+        """Wait for the download to finish.
+
+        :returns: The getter, with its forecast
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.getter
+
+
+def _is_dynamic(elem: ET.Element) -> bool:
+    return "$" in (elem.text or "") or any("$" in v for v in elem.attrib.values())
+
+
+def split_template(
+    template: Template, substitutions: Dict[str, str]
+) -> Tuple[bytes, Template]:
+    """Split a template into a static layer and a dynamic one to draw over it.
+
+    Everything that still has a placeholder after the given substitutions goes
+    in the dynamic layer, along with the groups around it and all the
+    definitions it might refer to; everything else goes in the static layer,
+    which can be rendered before the forecast arrives.
+
+    :param template: The template to split
+    :param substitutions: The substitutions that can be made already
+
+    :returns: The static layer as an SVG document, and the dynamic layer as a
+        template
+    """
+    source = template.safe_substitute(substitutions).encode()
+    for _, (prefix, uri) in ET.iterparse(BytesIO(source), events=("start-ns",)):
+        ET.register_namespace(prefix, uri)
+    static_root = ET.fromstring(source)
+    dynamic_root = ET.fromstring(source)
+    defs = f"{{{SVG_NS}}}defs"
+
+    def strip_dynamic(parent: ET.Element):
+        for child in list(parent):
+            if _is_dynamic(child):
+                parent.remove(child)
+            else:
+                strip_dynamic(child)
+
+    def strip_static(parent: ET.Element) -> bool:
+        # returns whether anything dynamic is left under the parent
+        kept = False
+        for child in list(parent):
+            if child.tag == defs or _is_dynamic(child) or strip_static(child):
+                kept = kept or child.tag != defs
+            else:
+                parent.remove(child)
+        return kept
+
+    strip_dynamic(static_root)
+    strip_static(dynamic_root)
+    return (
+        ET.tostring(static_root),
+        Template(ET.tostring(dynamic_root, encoding="unicode")),
+    )
+
+
+def _nth(values: Sequence[str], i: int) -> str:
+    return values[i] if i < len(values) else ""
 
 
 def die(
@@ -560,7 +2749,7 @@ def die(
     if msg is not NOMESSAGE:
         logger.error(msg, *args, **kwargs)
 
-    sys.exit(code)
+    sys.exit(code.value)
 
 
 def main(argv: List[str]) -> Optional[int]:
@@ -568,9 +2757,114 @@ def main(argv: List[str]) -> Optional[int]:
 
     weather_getter: WeatherGetter
 
-    metric = cast(bool, arguments["--metric"])
+    try:
+        timeout = float(cast(str, arguments["--timeout"]))
+        time_limit = int(cast(str, arguments["--time-limit"]))
+        max_age = float(cast(str, arguments["--max-age"]))
+        max_stale = float(cast(str, arguments["--max-stale"]))
+        dns_ttl = float(cast(str, arguments["--dns-ttl"]))
+    except ValueError:
+        die(Sysexits.EX_USAGE, "Timeouts and ages must be numbers of seconds")
+    if arguments["--metrics"]:
+        # written on the way out, however the run ends
+        atexit.register(METRICS.write, Path(arguments["--metrics"]))
+    # handlers run last first, so this is recorded before the metrics are written
+    atexit.register(report_peak_memory)
+    if time_limit > 0:
+        signal.signal(signal.SIGALRM, _time_limit_exceeded)
+        signal.alarm(time_limit)
+
+    handlers: List[urllib.request.BaseHandler] = []
+    if arguments["--replay"]:
+        handlers.append(
+            Replayer(
+                Path(arguments["--replay"]), not cast(bool, arguments["--replay-fast"])
+            )
+        )
+    if arguments["--record"]:
+        handlers.append(Recorder(Path(arguments["--record"])))
+    use_resolver(
+        Resolver(
+            Path(arguments["--dns-cache"]) if arguments["--dns-cache"] else None,
+            dns_ttl,
+        ),
+        *handlers,
+    )
+
+    if arguments["--relay"]:
+        return run_relay(
+            cast(str, arguments["--relay"]),
+            max_age,
+            cast(Optional[str], arguments["<accuweather_key>"]),
+            timeout,
+        )
+    if arguments["--relay-url"]:
+        relay_url = cast(str, arguments["--relay-url"]).rstrip("/")
+        for name, provider in PROVIDERS.items():
+            provider.BASE_URL = f"{relay_url}/{name}"
 
-    if (
+    metric = cast(bool, arguments["--metric"])
+    rotated = cast(bool, arguments["--rotated"])
+    language = cast(str, arguments["--language"])
+    if language not in DAY_NAMES:
+        die(
+            Sysexits.EX_USAGE,
+            'Unsupported language "%s", expected one of: %s',
+            language,
+            ", ".join(DAY_NAMES),
+        )
+    cache = (
+        ForecastCache(Path(arguments["--cache"]), max_age, max_stale)
+        if arguments["--cache"]
+        else None
+    )
+    health = ProviderHealth(
+        Path(arguments["--health"]) if arguments["--health"] else None
+    )
+
+    if arguments["--consensus"]:
+        policy = cast(str, arguments["--policy"])
+        if policy not in ConsensusGetter.POLICIES:
+            die(
+                Sysexits.EX_USAGE,
+                'Unsupported policy "%s", expected one of: %s',
+                policy,
+                ", ".join(ConsensusGetter.POLICIES),
+            )
+        getters = [
+            parse_consensus_source(
+                source,
+                cast(Optional[APIKey], arguments["<accuweather_key>"]),
+                metric=metric,
+                timeout=timeout,
+                cache=cache,
+                health=health,
+                language=language,
+            )
+            for source in cast(str, arguments["--consensus"]).split(",")
+        ]
+        logger.info("Consensus of %u providers", len(getters))
+        weather_getter = ConsensusGetter(
+            getters,
+            policy,
+            metric=metric,
+            timeout=timeout,
+            cache=cache,
+            language=language,
+        )
+    elif arguments["--batch"]:
+        template = read_template(cast(str, arguments["--template"]))
+        return run_batch(
+            cast(str, arguments["--batch"]),
+            template,
+            rotated,
+            metric,
+            timeout,
+            cache,
+            health,
+            language,
+        )
+    elif (
         arguments["<location>"]
         and arguments["--key"]
         and arguments["<accuweather_key>"]
@@ -579,7 +2873,15 @@ def main(argv: List[str]) -> Optional[int]:
         key = cast(APIKey, arguments["<accuweather_key>"])
 
         logger.info('AccuWeather: "%s"', location)
-        weather_getter = AccuWeatherGetter(key, location, metric=metric)
+        weather_getter = AccuWeatherGetter(
+            key,
+            location,
+            metric=metric,
+            timeout=timeout,
+            cache=cache,
+            health=health,
+            language=language,
+        )
     elif arguments["<zip>"]:
         zip_ = cast(str, arguments["<zip>"])
 
@@ -590,13 +2892,27 @@ def main(argv: List[str]) -> Optional[int]:
             zip_ = cast(ZipCode, match.group("zip"))
 
             logger.info('Weather.gov: "%s"', zip_)
-            weather_getter = WeatherGovGetter(zip_, metric=metric)
+            weather_getter = WeatherGovGetter(
+                zip_,
+                metric=metric,
+                timeout=timeout,
+                cache=cache,
+                health=health,
+                language=language,
+            )
         else:
             if zip_.isnumeric() and len(zip_) <= 4:
                 city_id = cast(CityID, int(zip_))
 
                 logger.info('WMO: "%s"', city_id)
-                weather_getter = WMOGetter(city_id, metric=metric)
+                weather_getter = WMOGetter(
+                    city_id,
+                    metric=metric,
+                    timeout=timeout,
+                    cache=cache,
+                    health=health,
+                    language=language,
+                )
             else:
                 die(Sysexits.EX_USAGE, 'Invalid ZIP Code/WMO City ID: "%s"', zip_)
     elif arguments["<city_id>"]:
@@ -608,7 +2924,14 @@ def main(argv: List[str]) -> Optional[int]:
             city_id = cast(CityID, int(city_id_str))
 
             logger.info('WMO: "%s"', city_id)
-            weather_getter = WMOGetter(city_id, metric=metric)
+            weather_getter = WMOGetter(
+                city_id,
+                metric=metric,
+                timeout=timeout,
+                cache=cache,
+                health=health,
+                language=language,
+            )
         else:
             die(Sysexits.EX_USAGE, 'WMO City ID must be numeric: "%s"', city_id)
     elif arguments["<latitude>"] and arguments["<longitude>"]:
@@ -626,12 +2949,179 @@ def main(argv: List[str]) -> Optional[int]:
 
         logger.info('Weather.gov: "%f/%f"', lat, lon)
         latlon = LatLon(lat, lon)
-        weather_getter = WeatherGovGetter(latlon, metric=metric)
+        weather_getter = WeatherGovGetter(
+            latlon,
+            metric=metric,
+            timeout=timeout,
+            cache=cache,
+            health=health,
+            language=language,
+        )
     else:
         # this shouldn't happen because of docopt
         die(Sysexits.EX_USAGE, "No location on command line")
 
-    template_path = cast(str, arguments["--template"])
+    pages = parse_pages(cast(str, arguments["--pages"] or ""))
+    renderer: Optional[SVGRenderer] = None
+    rendering = arguments["--framebuffer"] or arguments["--png"]
+
+    if arguments["--low-memory"]:
+        # one thing at a time: download and parse, then fill the template a
+        # line at a time straight into the renderer or out to stdout
+        weather_getter.get_weather()
+        substitutions = dict(
+            weather_getter.base_substitutions(rotated),
+            **weather_getter.forecast_substitutions(),
+        )
+        lines = stream_template(cast(str, arguments["--template"]), substitutions)
+        try:
+            if rendering:
+                renderer = SVGRenderer()
+                with METRICS.time("weather_render_seconds", layer="streamed"):
+                    raster = renderer.render_chunks(line.encode() for line in lines)
+            else:
+                for line in lines:
+                    sys.stdout.write(line)
+                sys.stdout.flush()
+        except MemoryError:
+            die(Sysexits.EX_OSERR, "Out of memory")
+    elif rendering:
+        # only the download itself stands between us and the output; do
+        # everything else while it is in flight
+        fetch = BackgroundFetch(weather_getter)
+        template = read_template(cast(str, arguments["--template"]))
+        static, dynamic = split_template(
+            template, weather_getter.base_substitutions(rotated)
+        )
+        renderer = SVGRenderer()
+        with METRICS.time("weather_render_seconds", layer="static"):
+            canvas = renderer.canvas(static)
+        fetch.wait()
+        with METRICS.time("weather_render_seconds", layer="dynamic"):
+            try:
+                canvas.draw(
+                    dynamic.substitute(
+                        weather_getter.forecast_substitutions()
+                    ).encode()
+                )
+            except MemoryError:
+                die(Sysexits.EX_OSERR, "Out of memory")
+            raster = canvas.finish()
+    else:
+        fetch = BackgroundFetch(weather_getter)
+        template = read_template(cast(str, arguments["--template"]))
+        fetch.wait()
+        try:
+            output = weather_getter.fill_template(template, rotated)
+        except MemoryError:
+            die(Sysexits.EX_OSERR, "Out of memory")
+        print(output, flush=True)
+
+    if rendering:
+        if arguments["--bilevel"]:
+            raster = dither(raster)
+        if arguments["--png"]:
+            write_png(
+                cast(str, arguments["--png"]),
+                raster,
+                cast(bool, arguments["--bilevel"]),
+            )
+        if arguments["--framebuffer"]:
+            Framebuffer(
+                cast(str, arguments["--framebuffer"]),
+                cast(bool, arguments["--invert"]),
+            ).write(raster)
+            if arguments["--refresh"]:
+                refresh(cast(str, arguments["--refresh"]))
+
+    write_pages(
+        weather_getter,
+        pages,
+        rotated,
+        cast(bool, arguments["--bilevel"]),
+        renderer,
+    )
+
+    if arguments["--diff"]:
+        record_changes(Path(arguments["--diff"]), weather_getter)
+
+    return None
+
+
+def parse_pages(pages: str) -> List[Tuple[str, str]]:
+    """Parse a comma-separated list of ``<template>:<output>`` pairs."""
+    parsed = []
+    for page in filter(None, pages.split(",")):
+        template_path, colon, output = page.partition(":")
+        if not (template_path and colon and output):
+            die(
+                Sysexits.EX_USAGE,
+                'Invalid page, expected <template>:<output>: "%s"',
+                page,
+            )
+        parsed.append((template_path, output))
+    return parsed
+
+
+def write_pages(
+    weather_getter: WeatherGetter,
+    pages: Sequence[Tuple[str, str]],
+    rotated: bool,
+    bilevel: bool = False,
+    renderer: Optional[SVGRenderer] = None,
+):
+    """Fill more templates with a forecast that has already been fetched.
+
+    :param weather_getter: The getter with the forecast
+    :param pages: The template and the output file of each page
+    :param rotated: Whether to rotate the output 180 degrees
+    :param bilevel: Whether to dither rendered pages to black and white
+    :param renderer: The renderer to reuse, if one is loaded already
+    """
+    for template_path, output in pages:
+        try:
+            filled = weather_getter.fill_template(read_template(template_path), rotated)
+        except MemoryError:
+            die(Sysexits.EX_OSERR, "Out of memory")
+        if not output.endswith(".png"):
+            try:
+                atomic_write(Path(output), filled.encode())
+            except OSError as e:
+                die(Sysexits.EX_IOERR, "Failed to write page %s: %s", output, e)
+            continue
+        if renderer is None:
+            renderer = SVGRenderer()
+        with METRICS.time("weather_render_seconds", layer="page"):
+            raster = renderer.render(filled.encode())
+        write_png(output, dither(raster) if bilevel else raster, bilevel)
+
+
+def refresh(command: str):
+    """Run a command to refresh the screen, exiting if it fails."""
+    try:
+        with METRICS.time("weather_refresh_seconds"):
+            subprocess.run(shlex.split(command), check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        die(Sysexits.EX_OSERR, "Failed to refresh the screen: %s", e)
+
+
+def stream_template(
+    template_path: str, substitutions: Dict[str, str]
+) -> Iterator[str]:
+    """Fill a template a line at a time, from a file or from stdin if ``-``.
+
+    Neither the whole template nor the whole output is ever held at once. No
+    template placeholder spans lines.
+    """
+    with (
+        nullcontext(sys.stdin) if template_path == "-" else open(template_path)
+    ) as f:
+        for line in f:
+            yield Template(line).substitute(substitutions)
+
+
+def read_template(template_path: str) -> Template:
+    """Read the template from a file, or from stdin if the path is ``-``."""
     if template_path == "-":
         if sys.stdin.isatty():
             logger.warning("Reading template from a terminal")
@@ -640,13 +3130,354 @@ def main(argv: List[str]) -> Optional[int]:
         with open(template_path) as f:
             template_string = f.read()
 
-    template = Template(template_string)
+    return Template(template_string)
+
+
+def parse_weather_gov_location(
+    fields: Sequence[str],
+) -> Optional[Union[ZipCode, LatLon]]:
+    """Parse a ZIP code or a latitude and longitude.
+
+    :param fields: Either a ZIP code, or a latitude and a longitude
+
+    :returns: The location, or None if it isn't valid
+    """
+    if len(fields) == 1:
+        match = ZIP_RE.fullmatch(fields[0].strip())
+        return cast(ZipCode, match.group("zip")) if match else None
+    if len(fields) == 2:
+        try:
+            return LatLon(float(fields[0]), float(fields[1]))
+        except ValueError:
+            return None
+    return None
+
+
+def parse_consensus_source(
+    source: str, key: Optional[APIKey], **kwargs
+) -> WeatherGetter:
+    """Parse a ``<provider>:<location>`` source of a consensus forecast.
+
+    :param source: The source
+    :param key: The AccuWeather API key, if there is one
+    :param **kwargs: Keyword arguments for the getter
+
+    :returns: The getter for the source; exits if it isn't valid
+    """
+    provider, _, location = source.strip().partition(":")
+    if provider == WeatherGovGetter.NAME:
+        weather_gov_location = parse_weather_gov_location(location.split("/"))
+        if weather_gov_location is not None:
+            return WeatherGovGetter(weather_gov_location, **kwargs)
+    elif provider == AccuWeatherGetter.NAME:
+        if not key:
+            die(Sysexits.EX_USAGE, "AccuWeather needs an API key (--key)")
+        if location:
+            return AccuWeatherGetter(key, cast(LocationKey, location), **kwargs)
+    elif provider == WMOGetter.NAME:
+        if location.isnumeric():
+            return WMOGetter(cast(CityID, int(location)), **kwargs)
+    die(
+        Sysexits.EX_USAGE,
+        'Invalid consensus source, expected <provider>:<location>: "%s"',
+        source,
+    )
+
+
+def run_batch(
+    manifest_path: str,
+    template: Template,
+    rotated: bool,
+    metric: bool,
+    timeout: float,
+    cache: Optional[ForecastCache] = None,
+    health: Optional[ProviderHealth] = None,
+    language: str = DEFAULT_LANGUAGE,
+) -> Optional[int]:
+    """Fill the template for every Weather.gov location in a batch manifest.
+
+    :param manifest_path: The manifest listing an output file and a location on
+        each line
+    :param template: The template to fill
+    :param rotated: Whether to rotate the output 180 degrees
+    :param metric: Whether to output metric units
+    :param timeout: Seconds to wait for the connection and for each read
+    :param cache: The cache to share forecasts through
+    :param health: The providers' circuit breakers
+    :param language: The language of the day names
+
+    :returns: None on success; exits if any location fails
+    """
+    try:
+        with open(manifest_path) as f:
+            lines = f.readlines()
+    except OSError as e:
+        die(Sysexits.EX_NOINPUT, "Failed to read batch manifest: %s", e)
+
+    jobs: List[Tuple[str, WeatherGovGetter]] = []
+    for line_number, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        output, *location_fields = fields
+        location = parse_weather_gov_location(location_fields)
+        if location is None:
+            die(
+                Sysexits.EX_DATAERR,
+                'Invalid location on line %u of batch manifest: "%s"',
+                line_number,
+                " ".join(location_fields),
+            )
+        jobs.append(
+            (
+                output,
+                WeatherGovGetter(
+                    location,
+                    metric=metric,
+                    timeout=timeout,
+                    cache=cache,
+                    health=health,
+                    language=language,
+                ),
+            )
+        )
+
+    failed = set(
+        WeatherGovGetter.get_weather_batch([getter for _, getter in jobs], timeout)
+    )
+
+    failures = 0
+    for output, getter in jobs:
+        if getter in failed:
+            failures += 1
+            continue
+        try:
+            filled = getter.fill_template(template, rotated)
+        except SystemExit:
+            # the getter's own fetch failed and has already been logged
+            failures += 1
+            continue
+        try:
+            atomic_write(Path(output), filled.encode())
+        except OSError as e:
+            die(Sysexits.EX_CANTCREAT, "Failed to write %s: %s", output, e)
+
+    if failures:
+        die(
+            Sysexits.EX_UNAVAILABLE,
+            "Failed to get the weather for %u of %u locations",
+            failures,
+            len(jobs),
+        )
+    return None
+
+
+class RelayResponse(NamedTuple):
+    status: int
+    reason: str
+    content_type: str
+    body: bytes
 
-    output = weather_getter.fill_template(template, cast(bool, arguments["--rotated"]))
-    print(output, flush=True)
 
+class RelayCache:
+    """Upstream responses shared by every display that asks a relay.
+
+    A successful response is kept for `ttl` seconds. A request for a URL that
+    is already being fetched waits for that fetch instead of making its own.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.responses: Dict[str, Tuple[float, RelayResponse]] = {}
+        self.in_flight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: str, fetch: Callable[[], RelayResponse]
+    ) -> Tuple[RelayResponse, str]:
+        """Get a response from the cache, or fetch it if nobody else is.
+
+        :param key: The cache key
+        :param fetch: Fetches the response from upstream
+
+        :returns: The response, and whether it was a ``hit``, a ``miss`` or
+            ``collapsed`` into another request's fetch
+        """
+        waited = False
+        while True:
+            with self._lock:
+                cached = self.responses.get(key)
+                if cached is not None and cached[0] > time.monotonic():
+                    return cached[1], "collapsed" if waited else "hit"
+                event = self.in_flight.get(key)
+                if event is None:
+                    event = self.in_flight[key] = threading.Event()
+                    break
+            event.wait()
+            waited = True
+
+        response: Optional[RelayResponse] = None
+        try:
+            response = fetch()
+            return response, "miss"
+        finally:
+            with self._lock:
+                now = time.monotonic()
+                for expired in [
+                    k for k, (expiry, _) in self.responses.items() if expiry <= now
+                ]:
+                    del self.responses[expired]
+                if response is not None and response.status == 200:
+                    self.responses[key] = (now + self.ttl, response)
+                del self.in_flight[key]
+            event.set()
+
+
+class RelayServer(ThreadingHTTPServer):
+    """Forward provider requests from displays on the LAN, through a cache.
+
+    A display asks for ``/<provider>/<path>``, as if the provider's
+    `ProviderGetter.BASE_URL` were ``http://<relay>/<provider>``. The relay keeps
+    the AccuWeather API key, if it was given one, so displays don't need it.
+    ``/metrics`` serves `METRICS`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        cache: RelayCache,
+        key: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        super().__init__(address, RelayHandler)
+        self.cache = cache
+        self.key = key
+        self.upstream_timeout = timeout
+        self.upstreams = {name: cls.BASE_URL for name, cls in PROVIDERS.items()}
+
+    def fetch(self, url: str) -> RelayResponse:
+        """Fetch a response from upstream, whatever its status."""
+        host = urllib.parse.urlsplit(url).netloc
+        try:
+            with closing(
+                urllib.request.urlopen(url, timeout=self.upstream_timeout)
+            ) as resp:
+                response = RelayResponse(
+                    resp.getcode(),
+                    resp.reason,
+                    resp.headers.get("Content-Type", "application/octet-stream"),
+                    resp.read(),
+                )
+        except HTTPError as e:
+            response = RelayResponse(
+                e.code,
+                str(e.reason),
+                e.headers.get("Content-Type", "text/plain"),
+                e.read(),
+            )
+        except (URLError, OSError) as e:
+            logger.error("Failed to relay %s: %s", redact(url), e)
+            return RelayResponse(502, "Bad Gateway", "text/plain", str(e).encode())
+        METRICS.inc("weather_received_bytes_total", len(response.body), host=host)
+        return response
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    server: RelayServer
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(
+                RelayResponse(
+                    200,
+                    "OK",
+                    "text/plain; version=0.0.4",
+                    METRICS.render().encode(),
+                )
+            )
+            return
+
+        provider, _, rest = self.path.lstrip("/").partition("/")
+        upstream = self.server.upstreams.get(provider)
+        if upstream is None:
+            self.send_error(404, "Unknown provider")
+            return
+        url = f"{upstream}/{rest}"
+        if self.server.key:
+            url = SECRET_PARAMETER_RE.sub(
+                lambda match: match.group("name") + cast(str, self.server.key), url
+            )
+        with METRICS.time("weather_relay_seconds", provider=provider):
+            response, result = self.server.cache.get(
+                redact(url), partial(self.server.fetch, url)
+            )
+        METRICS.inc("weather_relay_requests_total", provider=provider, result=result)
+        self._send(response)
+
+    def _send(self, response: RelayResponse):
+        self.send_response(response.status, response.reason)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), redact(format % args))
+
+
+def run_relay(
+    address: str, ttl: float, key: Optional[str], timeout: float
+) -> Optional[int]:
+    """Relay provider requests for the displays on the LAN until interrupted.
+
+    :param address: The ``[<host>]:<port>`` to listen on
+    :param ttl: Seconds to keep each response for
+    :param key: The AccuWeather API key to send upstream, if any
+    :param timeout: Seconds to wait for the connection and each read upstream
+
+    :returns: None when interrupted
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        server = RelayServer((host, int(port)), RelayCache(ttl), key, timeout)
+    except ValueError:
+        die(
+            Sysexits.EX_USAGE,
+            'Invalid relay address, expected <host>:<port>: "%s"',
+            address,
+        )
+    except OSError as e:
+        die(Sysexits.EX_OSERR, "Failed to start the relay: %s", e)
+    logger.info("Relaying on %s", address)
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
     return None
 
 
+def report_peak_memory():
+    """Log the most memory the process has had resident, and record it."""
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    logger.info("Peak memory use: %u KiB", peak_kib)
+    METRICS.set("weather_peak_rss_bytes", peak_kib * 1024)
+
+
+def _time_limit_exceeded(signum, frame) -> NoReturn:
+    die(Sysexits.EX_TEMPFAIL, "Time limit exceeded")
+
+
 if __name__ == "__main__":
-    sys.exit(main(sys.argv))
+    try:
+        sys.exit(main(sys.argv))
+    except SystemExit as e:
+        if e.code:
+            try:
+                code = Sysexits(e.code).name
+            except ValueError:
+                code = Sysexits.EX_GENERAL.name
+            METRICS.inc("weather_failures_total", code=code)
+        raise
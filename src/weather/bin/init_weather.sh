@@ -1,6 +1,18 @@
 #!/bin/sh
 
+# shellcheck source=../etc/weather_config.sh
+. /mnt/us/weather/etc/weather_config.sh
+
 /etc/init.d/framework stop  # kill the Kindle menus
 /etc/init.d/powerd stop  # keep the screen from turning off
 
-/mnt/us/weather/bin/update_weather.sh  # get the weather
+if [ -n "$POWER_SAVE" ]; then
+    # suspend between updates instead of staying awake for cron
+    nohup /mnt/us/weather/bin/schedule_weather.sh > /dev/null 2>&1 &
+else
+    /mnt/us/weather/bin/update_weather.sh  # get the weather
+    if [ -n "$PAGES" ]; then
+        # show the other pages in between updates
+        nohup /mnt/us/weather/bin/cycle_weather.sh > /dev/null 2>&1 &
+    fi
+fi
@@ -0,0 +1,92 @@
+#!/bin/sh
+# Update the weather on a schedule, suspending the Kindle in between.
+# Instead of leaving the device awake for cron, arm the RTC to wake up
+# just before each update is due, bring up the Wi-Fi, prepare the
+# weather, turn the Wi-Fi back off, show the weather when it is due,
+# and suspend again.
+
+cd /mnt/us/weather || exit 1
+
+BIN_DIR=bin
+CONFIG_DIR=etc
+CACHE_DIR=var/cache/weather
+
+UPDATE_WEATHER="$BIN_DIR/update_weather.sh"
+
+PID_FILE="$CACHE_DIR/schedule.pid"
+RTC_WAKEALARM="/sys/class/rtc/rtc0/wakealarm"
+POWER_STATE="/sys/power/state"
+
+# defaults; override them in weather_config.sh
+UPDATE_INTERVAL=3600
+PREFETCH_LEAD=120
+WIFI_TIMEOUT=60
+
+# shellcheck source=../etc/weather_config.sh
+. "$CONFIG_DIR/weather_config.sh"
+
+# don't bother suspending for less than this many seconds
+MIN_SUSPEND=30
+
+_now() {
+    date +%s
+}
+
+_sleep_until() {
+    # suspend until the given time, falling back to sleeping if the
+    # suspend fails or the Kindle wakes up early
+    _target="$1"
+    if [ $((_target - $(_now))) -ge "$MIN_SUSPEND" ]; then
+        echo 0 > "$RTC_WAKEALARM"
+        echo "$_target" > "$RTC_WAKEALARM" && echo mem > "$POWER_STATE"
+    fi
+    _left=$((_target - $(_now)))
+    if [ "$_left" -gt 0 ]; then
+        sleep "$_left"
+    fi
+}
+
+_wifi_up() {
+    # turn on the Wi-Fi and wait for it to connect
+    # returns 0 if connected, 1 if not connected within WIFI_TIMEOUT
+    lipc-set-prop com.lab126.cmd wirelessEnable 1
+    _waited=0
+    while [ "$_waited" -lt "$WIFI_TIMEOUT" ]; do
+        if [ "$(lipc-get-prop com.lab126.wifid cmState)" = "CONNECTED" ]; then
+            return 0
+        fi
+        sleep 1
+        _waited=$((_waited + 1))
+    done
+    return 1
+}
+
+_wifi_down() {
+    lipc-set-prop com.lab126.cmd wirelessEnable 0
+}
+
+
+## Main
+if [ -e "$PID_FILE" ] && kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+    echo "Already scheduled" >&2
+    exit 75
+fi
+echo "$$" > "$PID_FILE"
+
+# show the weather right away, then keep to the schedule
+"$UPDATE_WEATHER"
+_wifi_down
+
+while true; do
+    # the next update is due at the start of the next interval
+    _due=$((($(_now) / UPDATE_INTERVAL + 1) * UPDATE_INTERVAL))
+
+    _sleep_until $((_due - PREFETCH_LEAD))
+    if _wifi_up; then
+        "$UPDATE_WEATHER" prepare
+    fi
+    _wifi_down
+
+    _sleep_until "$_due"
+    "$UPDATE_WEATHER" show
+done
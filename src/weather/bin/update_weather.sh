@@ -6,44 +6,365 @@ BIN_DIR=bin
 CONFIG_DIR=etc
 STATIC_DIR=usr/share/weather
 CACHE_DIR=var/cache/weather
+# intermediate files live in RAM to spare the flash
+WORK_DIR=/tmp/weather
 
 DOWNLOAD_WEATHER="$BIN_DIR/download_weather.py"
+# prefer the precompiled build, which starts faster; remove it to run the
+# source instead
+if [ -e "$BIN_DIR/download_weather.pyz" ]; then
+    DOWNLOAD_WEATHER="$BIN_DIR/download_weather.pyz"
+fi
 RSVG_CONVERT="$BIN_DIR/rsvg-convert"
 PNGCRUSH="$BIN_DIR/pngcrush"
 EIPS="/usr/sbin/eips"
 
 TEMPLATE="$STATIC_DIR/weather_template.svg"
 
+LOCK_DIR="$WORK_DIR/update.lock"
+BUDGET_FILE="$WORK_DIR/budget"
+# textfiles for the Prometheus node exporter's textfile collector
+METRICS_FILE="$WORK_DIR/weather.prom"
+STAGE_METRICS_FILE="$WORK_DIR/stages.prom"
+SKIPPED_FILE="$WORK_DIR/skipped_publishes"
+# the forecast last prepared, and how much of the screen its changes need
+# redrawn; kept in RAM so the first update after a reboot redraws everything
+DIFF_FILE="$WORK_DIR/weather.json"
+# the frame on the screen, also written by cycle_weather.sh
+SHOWING_FILE="$WORK_DIR/showing"
+
+# default budgets; override them in weather_config.sh
+DOWNLOAD_BUDGET=90
+RENDER_BUDGET=60
+DISPLAY_BUDGET=30
+NETWORK_TIMEOUT=30
+MEMORY_LIMIT=65536
+WAVEFORM=du
+
 # shellcheck source=../etc/weather_config.sh
 . "$CONFIG_DIR/weather_config.sh"
 
-# save current images as old; mostly useful for debugging
-mv "$CACHE_DIR/weather_out.svg" "$CACHE_DIR/weather_out.svg.old"
-mv "$CACHE_DIR/weather_out.png" "$CACHE_DIR/weather_out.png.old"
-mv "$CACHE_DIR/weather.png" "$CACHE_DIR/weather.png.old"
+# seconds a stage may overrun its budget before it is killed, to give
+# download_weather.py the chance to hit its own time limit and exit cleanly
+GRACE=5
+
+_stage_metrics() {
+    # expose the budget record and the count of skipped publishes as metrics;
+    # a stage run more than once (rsvg, for each page) adds up its times
+    {
+        awk '
+            {
+                for (i = 3; i <= 5; i++) {
+                    split($i, field, "=")
+                    value[field[1], $1] += field[2]
+                }
+                stages[$1] = 1
+            }
+            END {
+                print "# HELP weather_stage_elapsed_seconds Time the stage took in the last run."
+                print "# TYPE weather_stage_elapsed_seconds gauge"
+                for (stage in stages) printf "weather_stage_elapsed_seconds{stage=\"%s\"} %d\n", stage, value["elapsed", stage]
+                print "# HELP weather_stage_budget_seconds Time the stage was allowed in the last run."
+                print "# TYPE weather_stage_budget_seconds gauge"
+                for (stage in stages) printf "weather_stage_budget_seconds{stage=\"%s\"} %d\n", stage, value["budget", stage]
+                print "# HELP weather_stage_failures Times the stage failed in the last run."
+                print "# TYPE weather_stage_failures gauge"
+                for (stage in stages) printf "weather_stage_failures{stage=\"%s\"} %d\n", stage, value["failed", stage]
+            }
+            $5 != "exit=0" { value["failed", $1]++ }
+        ' "$BUDGET_FILE"
+        echo "# HELP weather_skipped_publishes_total Frames not rendered or copied to flash because the forecast had not changed."
+        echo "# TYPE weather_skipped_publishes_total counter"
+        echo "weather_skipped_publishes_total $(cat "$SKIPPED_FILE" 2>/dev/null || echo 0)"
+    } > "$STAGE_METRICS_FILE.tmp" && mv "$STAGE_METRICS_FILE.tmp" "$STAGE_METRICS_FILE"
+}
+
+_unlock() {
+    # publish this run's budget record and metrics and release the lock
+    if [ -e "$BUDGET_FILE.tmp" ]; then
+        mv "$BUDGET_FILE.tmp" "$BUDGET_FILE"
+        _stage_metrics
+    fi
+    rm -rf "$LOCK_DIR"
+}
+
+_lock() {
+    # take the update lock, clearing it if the run that held it has died
+    # returns 0 if the lock was taken, 1 if another update is running
+    if ! mkdir "$LOCK_DIR" 2>/dev/null; then
+        _holder=$(cat "$LOCK_DIR/pid" 2>/dev/null)
+        if [ -n "$_holder" ] && kill -0 "$_holder" 2>/dev/null; then
+            return 1
+        fi
+        rm -rf "$LOCK_DIR"
+        mkdir "$LOCK_DIR" 2>/dev/null || return 1
+    fi
+    echo "$$" > "$LOCK_DIR/pid"
+    trap _unlock EXIT
+    trap 'exit 143' INT TERM
+    return 0
+}
+
+_stage() {
+    # run one stage of the update within its time and memory budget and
+    # record how it went
+    # usage: _stage <name> <budget in seconds> <command> [<argument>...]
+    _name="$1"
+    _budget="$2"
+    shift 2
 
-"$DOWNLOAD_WEATHER" ${ROTATED:+"--rotated"} ${METRIC:+"--metric"} --template ${TEMPLATE:?"missing TEMPLATE"} ${KEY:+"--key"} ${KEY:+"$KEY"} -- ${ZIP:+"$ZIP"} ${LAT:+"$LAT"} ${LON:+"$LON"} ${LOCATION:+"$LOCATION"} ${CITY_ID:+"$CITY_ID"} > "$CACHE_DIR/weather_out.svg"
+    _start=$(date +%s)
+    (ulimit -v "$MEMORY_LIMIT" 2>/dev/null; exec "$@") &
+    _pid=$!
+    # the watchdog takes its sleep down with it when it is stopped, and keeps
+    # off stdout and stderr, so that nothing reading them waits on it
+    (
+        sleep $((_budget + GRACE)) &
+        _sleep=$!
+        trap 'kill "$_sleep" 2>/dev/null; exit 0' TERM
+        wait "$_sleep" && kill "$_pid" 2>/dev/null
+    ) < /dev/null > /dev/null 2>&1 &
+    _watchdog=$!
+    wait "$_pid"
+    _ret=$?
+    kill "$_watchdog" 2>/dev/null
+    _elapsed=$(($(date +%s) - _start))
 
-# convert the svg to a png with white background (no transparency allowed!)
-"$RSVG_CONVERT" --background-color=white -o "$CACHE_DIR/weather_out.png" "$CACHE_DIR/weather_out.svg"
+    if [ "$_elapsed" -gt "$_budget" ]; then
+        _status="over"
+    elif [ "$_ret" -ne 0 ]; then
+        _status="failed"
+    else
+        _status="ok"
+    fi
+    echo "$_name $_status elapsed=$_elapsed budget=$_budget exit=$_ret" >> "$BUDGET_FILE.tmp"
 
-# change png to greyscale without alpha (color type (-c) 0)
-"$PNGCRUSH" -qf -c 0 "$CACHE_DIR/weather_out.png" "$CACHE_DIR/weather.png"
+    return "$_ret"
+}
 
-# clear the screen twice to prevent ghosting
-"$EIPS" -c
-"$EIPS" -c
+_download() {
+    # run download_weather.py as a stage, with any extra options given
+    # usage: _download <name> <budget in seconds> [<option>...]
+    _download_name="$1"
+    _download_budget="$2"
+    shift 2
+    if [ -n "$CONSENSUS" ]; then
+        set -- "$@" ${KEY:+"--key"} ${KEY:+"$KEY"} --consensus "$CONSENSUS" ${CONSENSUS_POLICY:+"--policy"} ${CONSENSUS_POLICY:+"$CONSENSUS_POLICY"}
+    else
+        set -- "$@" ${KEY:+"--key"} ${KEY:+"$KEY"} -- ${ZIP:+"$ZIP"} ${LAT:+"$LAT"} ${LON:+"$LON"} ${LOCATION:+"$LOCATION"} ${CITY_ID:+"$CITY_ID"}
+    fi
+    _stage "$_download_name" "$_download_budget" "$DOWNLOAD_WEATHER" ${ROTATED:+"--rotated"} ${METRIC:+"--metric"} ${DISPLAY_LANGUAGE:+"--language"} ${DISPLAY_LANGUAGE:+"$DISPLAY_LANGUAGE"} ${LOW_MEMORY:+"--low-memory"} --template ${TEMPLATE:?"missing TEMPLATE"} --timeout "$NETWORK_TIMEOUT" --time-limit "$_download_budget" --metrics "$METRICS_FILE" --cache "$WORK_DIR/forecasts" ${CACHE_MAX_AGE:+"--max-age"} ${CACHE_MAX_AGE:+"$CACHE_MAX_AGE"} --dns-cache "$CACHE_DIR/dns.json" --health "$CACHE_DIR/health.json" ${CACHE_MAX_STALE:+"--max-stale"} ${CACHE_MAX_STALE:+"$CACHE_MAX_STALE"} ${DNS_TTL:+"--dns-ttl"} ${DNS_TTL:+"$DNS_TTL"} ${RELAY_URL:+"--relay-url"} ${RELAY_URL:+"$RELAY_URL"} "$@"
+}
 
-# if everything worked, put the weather up; if not, show an error
-if [ -e "$CACHE_DIR/weather.png" ]; then
-    "$EIPS" -g "$CACHE_DIR/weather.png"
-    exit $?
-else
+_fail() {
+    # give up on this update and put up the error screen
+    rm -f "$CACHE_DIR/weather.png" "$WORK_DIR/weather.png" "$DIFF_FILE"
     "$EIPS" -g "$STATIC_DIR/error${ROTATED+_rotated}.png"
     _RET=$?
+    echo error.png > "$SHOWING_FILE"
     if [ "$_RET" -ne 0 ]; then
         exit "$_RET"
     else
         exit 1
     fi
+}
+
+_publish() {
+    # keep a new frame on flash for after a reboot, replacing the old one in a
+    # single rename. Frames are shown from the working directory, and the time
+    # in the footer makes every frame differ, so leave the flash alone unless
+    # the forecast itself has changed
+    # usage: _publish <frame> [<published name>]
+    _published="$CACHE_DIR/${2:-weather.png}"
+    if [ ! -e "$_published" ] || _forecast_changed; then
+        cp "$1" "$_published.tmp" && mv "$_published.tmp" "$_published"
+    else
+        _skipped
+    fi
+}
+
+_frame() {
+    # the newest copy of a frame: the one in the working directory, or the one
+    # on flash if there isn't one, such as after a reboot
+    # usage: _frame <name>
+    if [ -e "$WORK_DIR/$1" ]; then
+        echo "$WORK_DIR/$1"
+    else
+        echo "$CACHE_DIR/$1"
+    fi
+}
+
+_skipped() {
+    # count a frame that didn't need publishing
+    echo $(($(cat "$SKIPPED_FILE" 2>/dev/null || echo 0) + 1)) > "$SKIPPED_FILE"
+}
+
+_pages() {
+    # the --pages argument that fills each of PAGES into page_<n><extension>
+    # usage: _pages <extension>
+    _list=""
+    _n=0
+    for _page in $PAGES; do
+        _n=$((_n + 1))
+        _list="${_list:+$_list,}$STATIC_DIR/$_page:$WORK_DIR/page_$_n$1"
+    done
+    echo "$_list"
+}
+
+_publish_pages() {
+    # publish the frame of each of PAGES
+    _n=0
+    for _page in $PAGES; do
+        _n=$((_n + 1))
+        _publish "$WORK_DIR/page_$_n.png" "page_$_n.png" || return 1
+    done
+}
+
+_render() {
+    # render <name>.svg in the working directory to <name>.png, ready for eips
+    # usage: _render <name>
+    # convert the svg to a png with white background (no transparency allowed!)
+    _stage rsvg "$RENDER_BUDGET" "$RSVG_CONVERT" --background-color=white -o "$WORK_DIR/$1_rsvg.png" "$WORK_DIR/$1.svg" || _fail
+
+    # change png to greyscale without alpha (color type (-c) 0)
+    _stage pngcrush "$RENDER_BUDGET" "$PNGCRUSH" -qf -c 0 "$WORK_DIR/$1_rsvg.png" "$WORK_DIR/$1.png" || _fail
+}
+
+_prepare() {
+    # download the weather and render it to a png, ready to display
+    if [ -n "$FRAMEBUFFER" ]; then
+        # rendering happens straight into the framebuffer when showing, so
+        # just make sure the forecast is in the cache by then, and build any
+        # extra pages, along with a frame of the weather for cycle_weather.sh
+        # to come back to
+        rm -f "$WORK_DIR/weather.png"
+        _download download "$DOWNLOAD_BUDGET" --diff "$DIFF_FILE" ${BILEVEL:+"--bilevel"} ${PAGES:+"--png"} ${PAGES:+"$WORK_DIR/weather.png"} ${PAGES:+"--pages"} ${PAGES:+"$(_pages .png)"} > /dev/null || _fail
+        if [ -n "$PAGES" ]; then
+            _publish "$WORK_DIR/weather.png" || _fail
+            _publish_pages || _fail
+        fi
+        return
+    fi
+
+    if [ -n "$DEBUG" ]; then
+        # keep the previous run's files for comparison
+        for _file in weather.svg weather_rsvg.png weather.png; do
+            [ -e "$WORK_DIR/$_file" ] && mv "$WORK_DIR/$_file" "$WORK_DIR/$_file.old"
+        done
+    fi
+    rm -f "$WORK_DIR/weather.png"
+
+    if [ -n "$BILEVEL" ]; then
+        # render and dither straight to a 1-bit png
+        _download download "$DOWNLOAD_BUDGET" --diff "$DIFF_FILE" --bilevel --png "$WORK_DIR/weather.png" ${PAGES:+"--pages"} ${PAGES:+"$(_pages .png)"} > /dev/null || _fail
+    else
+        _download download "$DOWNLOAD_BUDGET" --diff "$DIFF_FILE" ${PAGES:+"--pages"} ${PAGES:+"$(_pages .svg)"} > "$WORK_DIR/weather.svg" || _fail
+        if [ "$(_refresh_hint)" = "none" ] && [ -e "$CACHE_DIR/weather.png" ]; then
+            # nothing on the screen would change, so don't render it again
+            _skipped
+            return
+        fi
+        _render weather
+
+        _n=0
+        for _page in $PAGES; do
+            _n=$((_n + 1))
+            _render "page_$_n"
+        done
+    fi
+
+    _publish "$WORK_DIR/weather.png" || _fail
+    _publish_pages || _fail
+}
+
+_clear() {
+    # clear the screen twice to prevent ghosting; black and white images
+    # don't ghost, so skip the slow clears for them
+    if [ -z "$BILEVEL" ]; then
+        "$EIPS" -c
+        "$EIPS" -c
+    fi
+}
+
+_refresh_hint() {
+    # how much of the screen the prepared forecast needs redrawn: none, footer
+    # (only the time moved on), text, icons or full; full if nothing was
+    # recorded
+    _hint=$(sed -n 's/^{"refresh":"\([a-z]*\)".*/\1/p' "$DIFF_FILE" 2>/dev/null)
+    echo "${_hint:-full}"
+}
+
+_forecast_changed() {
+    # whether the prepared forecast differs from the last one, not counting
+    # the time in the footer; yes if nothing was recorded
+    case "$(_refresh_hint)" in
+    none | footer) return 1 ;;
+    esac
+}
+
+_show() {
+    # put the prepared weather up, redrawing only as much as has changed since
+    # the last update; if there isn't any, show an error
+    _refresh=$(_refresh_hint)
+    if [ "$(cat "$SHOWING_FILE" 2>/dev/null || echo weather.png)" != "weather.png" ]; then
+        # another page is up, and a partial refresh over it would ghost
+        _refresh=full
+    fi
+    if [ -n "$FRAMEBUFFER" ]; then
+        [ "$_refresh" = "none" ] && return
+        # render the (cached) forecast straight into the framebuffer, skipping
+        # the png, and have eips refresh the screen from it
+        [ "$_refresh" = "full" ] && _clear
+        _download display "$DISPLAY_BUDGET" --framebuffer "$FRAMEBUFFER" ${FB_INVERT:+"--invert"} ${BILEVEL:+"--bilevel"} --refresh "$EIPS ''" || _fail
+        echo weather.png > "$SHOWING_FILE"
+        return
+    fi
+
+    _weather=$(_frame weather.png)
+    if [ ! -e "$_weather" ]; then
+        _fail
+    fi
+    [ "$_refresh" = "none" ] && return
+
+    if [ -n "$BILEVEL" ]; then
+        # a pure black and white image can use a fast partial refresh
+        _stage display "$DISPLAY_BUDGET" "$EIPS" -g "$_weather" ${WAVEFORM:+"-w"} ${WAVEFORM:+"$WAVEFORM"}
+    elif [ "$_refresh" = "footer" ] || [ "$_refresh" = "text" ]; then
+        # a new time, or a few changed numbers and words, barely ghost; skip
+        # the clears and the flash
+        _stage display "$DISPLAY_BUDGET" "$EIPS" -g "$_weather"
+    elif [ "$_refresh" = "icons" ]; then
+        # new icons need a flash to come out clean, but not the clears
+        _stage display "$DISPLAY_BUDGET" "$EIPS" -f -g "$_weather"
+    else
+        _clear
+        _stage display "$DISPLAY_BUDGET" "$EIPS" -g "$_weather"
+    fi
+    echo weather.png > "$SHOWING_FILE"
+}
+
+
+## Main
+mkdir -p "$WORK_DIR" || exit 1
+# "prepare" only downloads and renders, "show" only displays what was
+# prepared; by default, do both
+if ! _lock; then
+    echo "Another update is already running" >&2
+    exit 75
 fi
+rm -f "$BUDGET_FILE.tmp"
+
+case "${1:-all}" in
+"prepare")
+    _prepare
+    ;;
+"show")
+    # keep the record of the run that prepared what we're showing
+    [ -e "$BUDGET_FILE" ] && cp "$BUDGET_FILE" "$BUDGET_FILE.tmp"
+    _show
+    ;;
+*)
+    _prepare
+    _show
+    ;;
+esac
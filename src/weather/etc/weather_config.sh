@@ -12,13 +12,119 @@
 
 # Uncomment if you want metric units
 # (Celsius instead of Farhenheit)
-# Only works with AccuWeather and WMO, ignored by Weather.gov
 # This variable is checked for being set and not null;
 # the value does not matter. For example,
 # `METRIC="0"` would also count as set. `METRIC=""` would
 # count as unset.
 #METRIC="1"
 
+# Uncomment to show the day names in another language: one of
+# da, de, en, es, fi, fr, it, nb, nl, pl, pt or sv.
+# The default is English.
+#DISPLAY_LANGUAGE="de"
+
+# Limits for each run of the hourly update, so that a stalled
+# connection can't pile up updates on the Kindle.
+# Each stage (download, render, display) is killed once it runs
+# past its budget, in seconds, and the error screen is shown.
+# Each request gives up after NETWORK_TIMEOUT seconds without
+# data, and every stage is limited to MEMORY_LIMIT KiB of memory.
+# The outcome of each stage of the last run is recorded in
+# /tmp/weather/budget.
+# Counters and timings of the updates (requests, bytes, cache hits,
+# parse, render and refresh times, failures) are kept in
+# /tmp/weather/weather.prom and /tmp/weather/stages.prom, for the
+# Prometheus node exporter's textfile collector.
+#DOWNLOAD_BUDGET="90"
+#RENDER_BUDGET="60"
+#DISPLAY_BUDGET="30"
+#NETWORK_TIMEOUT="30"
+#MEMORY_LIMIT="65536"
+
+# Uncomment on Kindles short of memory (Touch, Paperwhite) to keep
+# the download to as little memory as possible: it downloads first,
+# then fills the template a line at a time, without ever holding
+# all of it. See "Memory" in the README for how much is needed.
+# This variable is checked for being set and not null;
+# the value does not matter.
+#LOW_MEMORY="1"
+
+# Forecasts are cached in /tmp/weather/forecasts and reused
+# for up to CACHE_MAX_AGE seconds instead of being downloaded
+# again. Keep this below the update interval so that every hourly
+# update gets a fresh forecast.
+#CACHE_MAX_AGE="3000"
+
+# A provider that keeps failing is left alone for a while, longer
+# after each failure, and the last forecast is shown instead as
+# long as it is less than CACHE_MAX_STALE seconds old. Which
+# providers are down is kept in var/cache/weather/health.json.
+#CACHE_MAX_STALE="86400"
+
+# Host name lookups are remembered in var/cache/weather/dns.json
+# for DNS_TTL seconds, so that a Kindle that has just woken up can
+# start connecting right away. The file is only written when a
+# lookup expires.
+#DNS_TTL="3600"
+
+# Uncomment to fetch forecasts through a relay on your network
+# instead of from the providers, so that several Kindles share
+# each download. See "Sharing Downloads" in the README for how to
+# start one. A relay that was given the AccuWeather API key fills
+# it in, so KEY can then be set to anything.
+#RELAY_URL="http://192.168.1.10:8080"
+
+# Uncomment to let the Kindle sleep between updates, which uses
+# far less power than staying awake for the hourly cron job.
+# The Kindle wakes up PREFETCH_LEAD seconds before each update is
+# due, turns on the Wi-Fi for at most WIFI_TIMEOUT seconds to
+# download the weather, and shows it at the start of every
+# UPDATE_INTERVAL seconds.
+# The crontab entry isn't needed in this mode.
+# This variable is checked for being set and not null;
+# the value does not matter.
+#POWER_SAVE="1"
+#UPDATE_INTERVAL="3600"
+#PREFETCH_LEAD="120"
+#WIFI_TIMEOUT="60"
+
+# Uncomment to render the weather straight into the framebuffer
+# instead of going through a png, which saves converting and
+# decoding the image on every update. The framebuffer must be
+# 8-bit grayscale; set FB_INVERT if it stores white as 0.
+# These variables are checked for being set and not null.
+#FRAMEBUFFER="/dev/fb0"
+#FB_INVERT="1"
+
+# Uncomment to dither the weather to pure black and white. The
+# layout stays the same, gray areas become a dot pattern, and the
+# screen can skip clearing and update with the fast WAVEFORM,
+# which must be one that your Kindle's eips accepts after -w.
+# Set WAVEFORM="" to let eips choose.
+# BILEVEL is checked for being set and not null.
+#BILEVEL="1"
+#WAVEFORM="du"
+
+# Each update works in /tmp/weather, which is in RAM, and shows
+# the finished image from there. It only writes the image to
+# var/cache/weather, for after a reboot, when the forecast has
+# changed, to spare the Kindle's flash.
+# Uncomment to keep the previous update's files in /tmp/weather
+# as *.old for comparison.
+# This variable is checked for being set and not null;
+# the value does not matter.
+#DEBUG="1"
+
+# Uncomment to show more pages, filled from the same forecast, in
+# turn with the weather. List the templates of the extra pages,
+# separated by spaces, from usr/share/weather; every page is
+# rendered once per update and the screen moves on to the next one
+# every CYCLE_INTERVAL seconds.
+# The Kindle has to stay awake for this, so it doesn't work with
+# POWER_SAVE.
+#PAGES="weather_detail_template.svg"
+#CYCLE_INTERVAL="60"
+
 ################################################################################
 # Uncomment and set ALL the configuration values for ONE of the sections below #
 ################################################################################
@@ -69,3 +175,18 @@ ZIP="10001"
 # https://worldweather.wmo.int/en/json/full_city_list.txt
 #CITY_ID="278"
 
+#--------------------------------#
+# Consensus of several providers #
+#--------------------------------#
+# Asks every listed provider at once and merges their forecasts,
+# for when accuracy matters more than a single request.
+
+# A comma-separated list of <provider>:<location>, where the location is
+# a ZIP code or <latitude>/<longitude> for weather.gov, a location key
+# for accuweather (also set KEY above) or a City ID for wmo.
+# Providers that don't answer within NETWORK_TIMEOUT are left out.
+#CONSENSUS="weather.gov:10001,wmo:278"
+
+# "median" takes the median temperature and the most common icon;
+# "priority" takes every value from the first provider listed that has it.
+#CONSENSUS_POLICY="median"
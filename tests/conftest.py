@@ -0,0 +1,15 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+SOURCE = Path(__file__).parent.parent / "src/weather/bin/download_weather.py"
+
+
+@pytest.fixture(scope="session")
+def dw():
+    """download_weather.py, which isn't an importable module."""
+    spec = importlib.util.spec_from_file_location("download_weather", str(SOURCE))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore
+    return module
@@ -0,0 +1,128 @@
+import io
+import math
+import random
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+FCICONS = "http://www.nws.noaa.gov/weather/images/fcicons/"
+
+
+def dwml(highs):
+    """A multi-point DWML response, with one location per high."""
+    locations = "".join(
+        f"""<parameters applicable-location="point{i}">
+<temperature type="maximum"><value>{high}</value><value>50</value></temperature>
+<temperature type="minimum"><value>32</value></temperature>
+<probability-of-precipitation><value>10</value><value>40</value>
+</probability-of-precipitation>
+<weather><weather-conditions weather-summary="Sunny"/></weather>
+<conditions-icon><icon-link>{FCICONS}skc.jpg</icon-link></conditions-icon>
+</parameters>"""
+        for i, high in enumerate(highs, 1)
+    )
+    return f"""<?xml version="1.0"?>
+<dwml><data>
+<time-layout>
+<start-valid-time>2026-10-19T06:00:00-04:00</start-valid-time>
+</time-layout>
+{locations}
+</data></dwml>""".encode()
+
+
+def distance_km(dw, a, b):
+    lat = math.radians((a.lat + b.lat) / 2)
+    return dw.WeatherGovGetter.DEGREE_KM * math.hypot(
+        a.lat - b.lat, (a.lon - b.lon) * math.cos(lat)
+    )
+
+
+def test_snap_leaves_zip_codes_alone(dw):
+    assert dw.WeatherGovGetter.snap(dw.ZipCode("12345")) == "12345"
+
+
+def test_snap_shares_a_cell_between_neighbours(dw):
+    snap = dw.WeatherGovGetter.snap
+    center = snap(dw.LatLon(40.0, -75.0))
+
+    assert snap(center) == center
+    assert snap(dw.LatLon(center.lat + 0.005, center.lon - 0.005)) == center
+    assert snap(dw.LatLon(center.lat + 0.03, center.lon)) != center
+
+
+def test_snap_stays_within_half_a_cell_diagonal(dw):
+    rng = random.Random(0)
+    half_diagonal = dw.WeatherGovGetter.GRID_KM / math.sqrt(2)
+
+    for _ in range(1000):
+        point = dw.LatLon(rng.uniform(20, 60), rng.uniform(-160, -65))
+        assert distance_km(dw, point, dw.WeatherGovGetter.snap(point)) <= half_diagonal
+
+
+def test_extract_all_splits_locations(dw):
+    getter = dw.WeatherGovGetter(dw.ZipCode("12345"))
+
+    forecasts = getter._extract_all(io.BytesIO(dwml([68, 77])))
+
+    assert list(forecasts) == ["point1", "point2"]
+    assert forecasts["point1"].highs == (20.0, 10.0)
+    assert forecasts["point2"].highs == (25.0, 10.0)
+    assert forecasts["point2"].lows == (0.0,)
+    assert forecasts["point2"].pops == ("40",)
+    assert forecasts["point2"].icons == ("skc",)
+    assert str(forecasts["point2"].first_date) == "2026-10-19"
+
+
+@pytest.fixture
+def requests(dw, monkeypatch):
+    """Answer batch requests with a high of 32 + the location's index °F."""
+    urls = []
+
+    @contextmanager
+    def open_url(url, timeout=None):
+        urls.append(url)
+        query = parse_qs(urlsplit(url).query)
+        locations = (query.get("zipCodeList") or query["listLatLon"])[0].split(" ")
+        yield io.BytesIO(dwml([32 + 18 * i for i in range(len(locations))]))
+
+    monkeypatch.setattr(dw, "open_url", open_url)
+    monkeypatch.setattr(dw.WeatherGovGetter, "BATCH_SIZE", 3)
+    return urls
+
+
+def test_batch_splits_requests(dw, requests):
+    zips = [dw.WeatherGovGetter(dw.ZipCode(f"1234{i}")) for i in range(4)]
+    points = [dw.WeatherGovGetter(dw.LatLon(40.0 + i, -75.0)) for i in range(2)]
+    # a neighbour that snaps to the same cell rides along in the same request
+    neighbour = dw.WeatherGovGetter(dw.LatLon(40.001, -75.0))
+    getters = zips + points + [neighbour]
+
+    assert dw.WeatherGovGetter.get_weather_batch(getters) == []
+
+    queries = [parse_qs(urlsplit(url).query) for url in requests]
+    assert [query.get("zipCodeList") for query in queries] == [
+        ["12340 12341 12342"],
+        ["12343"],
+        None,
+    ]
+    assert queries[2]["listLatLon"] == [
+        " ".join(f"{getter.location.lat},{getter.location.lon}" for getter in points)
+    ]
+    assert [getter._forecast.highs[0] for getter in zips] == [0.0, 10.0, 20.0, 0.0]
+    assert [getter._forecast.highs[0] for getter in points] == [0.0, 10.0]
+    assert neighbour._forecast == points[0]._forecast
+
+
+def test_batch_stops_after_a_failed_request(dw, requests, monkeypatch):
+    @contextmanager
+    def unavailable(url, timeout=None):
+        requests.append(url)
+        dw.die(dw.Sysexits.EX_UNAVAILABLE, "Failed to retrieve weather data")
+        yield
+
+    monkeypatch.setattr(dw, "open_url", unavailable)
+    getters = [dw.WeatherGovGetter(dw.ZipCode(f"1234{i}")) for i in range(5)]
+
+    assert dw.WeatherGovGetter.get_weather_batch(getters) == getters
+    assert len(requests) == 1
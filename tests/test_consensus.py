@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+
+MONDAY = date(2026, 10, 19)
+
+
+@pytest.fixture
+def forecasts(dw):
+    return [
+        dw.Forecast(
+            first_date=MONDAY,
+            highs=(20.0, 18.0),
+            lows=(10.0, None),
+            icons=("skc", "ra"),
+            pops=("10", "60"),
+            wind_speeds=(10.0, 20.0),
+            wind_directions=("N", "NW"),
+            summaries=("Sunny", ""),
+            headline="",
+        ),
+        dw.Forecast(
+            first_date=MONDAY,
+            highs=(22.0, 16.0),
+            lows=(12.0, 8.0),
+            icons=("few", "ra"),
+            pops=("20", "80"),
+            summaries=("Clear", "Showers"),
+            headline="Rain moving in",
+        ),
+        dw.Forecast(
+            first_date=MONDAY,
+            highs=(24.0, 17.0),
+            lows=(11.0, 9.0),
+            icons=("few", "na"),
+            pops=("30", "75"),
+        ),
+    ]
+
+
+def merge(dw, policy, forecasts):
+    return dw.ConsensusGetter([], policy).merge(forecasts)
+
+
+def test_median(dw, forecasts):
+    merged = merge(dw, "median", forecasts)
+
+    assert merged.first_date == MONDAY
+    assert merged.highs == (22.0, 17.0)
+    assert merged.lows == (11.0, 8.5)
+    assert merged.icons == ("few", "ra")
+    assert merged.pops == ("20", "75")
+    assert merged.wind_speeds == (10.0, 20.0)
+    # text always comes by priority
+    assert merged.summaries == ("Sunny", "Showers")
+    assert merged.headline == "Rain moving in"
+
+
+def test_priority(dw, forecasts):
+    merged = merge(dw, "priority", forecasts)
+
+    assert merged.highs == (20.0, 18.0)
+    assert merged.lows == (10.0, 8.0)
+    assert merged.icons == ("skc", "ra")
+    assert merged.pops == ("10", "60")
+
+
+@pytest.mark.parametrize("policy", ["median", "priority"])
+def test_missing_provider(dw, forecasts, policy):
+    merged = merge(dw, policy, forecasts[1:])
+
+    assert merged.highs == ((23.0, 16.5) if policy == "median" else (22.0, 16.0))
+    assert merged.icons == ("few", "ra")
+    assert merged.wind_speeds == (None, None)
+    assert merged.wind_directions == ("", "")
+
+
+def test_days_follow_the_first_provider(dw, forecasts):
+    later = forecasts[2]._replace(
+        first_date=date(2026, 10, 20), highs=(30.0, 30.0), icons=("hot", "hot")
+    )
+
+    merged = merge(dw, "median", [forecasts[0], later])
+
+    assert merged.first_date == MONDAY
+    assert merged.highs == (20.0, 24.0)
+    assert merged.icons == ("skc", "ra")
@@ -0,0 +1,63 @@
+FIELDS = {
+    "day": ["Monday", "Tuesday"],
+    "date": ["2026-10-19", "2026-10-20"],
+    "high": ["64", "58"],
+    "low": ["41", "39"],
+    "icon": ["skc", "ra"],
+    "summary": ["Sunny", "Rain"],
+    "updated": ["2026-10-19T06:00:00"],
+}
+
+
+def changed(**fields):
+    return dict(FIELDS, **fields)
+
+
+def test_diff_lists_each_changed_day(dw):
+    changes = dw.diff_forecasts(FIELDS, changed(high=["64", "61"], low=["40", "39"]))
+
+    assert changes == [
+        dw.ForecastChange(1, "high", "58", "61"),
+        dw.ForecastChange(0, "low", "41", "40"),
+    ]
+
+
+def test_diff_covers_added_and_removed_days(dw):
+    changes = dw.diff_forecasts(FIELDS, changed(high=["64"], icon=["skc", "ra", "sn"]))
+
+    assert changes == [
+        dw.ForecastChange(1, "high", "58", ""),
+        dw.ForecastChange(2, "icon", "", "sn"),
+    ]
+
+
+def test_nothing_changed(dw):
+    assert dw.classify_changes(dw.diff_forecasts(FIELDS, FIELDS)) == dw.Refresh.NONE
+
+
+def test_only_the_footer_changed(dw):
+    changes = dw.diff_forecasts(FIELDS, changed(updated=["2026-10-19T07:00:00"]))
+
+    assert dw.classify_changes(changes) == dw.Refresh.FOOTER
+
+
+def test_text_changed(dw):
+    changes = dw.diff_forecasts(
+        FIELDS, changed(high=["65", "58"], updated=["2026-10-19T07:00:00"])
+    )
+
+    assert dw.classify_changes(changes) == dw.Refresh.TEXT
+
+
+def test_icon_changed(dw):
+    changes = dw.diff_forecasts(FIELDS, changed(icon=["skc", "tsra"]))
+
+    assert dw.classify_changes(changes) == dw.Refresh.ICONS
+
+
+def test_days_moved_on(dw):
+    changes = dw.diff_forecasts(
+        FIELDS, changed(day=["Tuesday", "Wednesday"], icon=["ra", "sn"])
+    )
+
+    assert dw.classify_changes(changes) == dw.Refresh.FULL
@@ -0,0 +1,97 @@
+import pytest
+
+
+@pytest.fixture
+def clock(dw, monkeypatch):
+    """Control the time, and take the longest backoff instead of a random one."""
+    now = [1_000_000.0]
+    spans = []
+
+    def uniform(low, high):
+        spans.append((low, high))
+        return high
+
+    monkeypatch.setattr(dw.time, "time", lambda: now[0])
+    monkeypatch.setattr(dw.random, "uniform", uniform)
+    return now, spans
+
+
+def test_opens_after_repeated_failures(dw, clock):
+    now, _ = clock
+    health = dw.ProviderHealth()
+
+    health.record_failure("wmo")
+    assert health.state("wmo") == "closed"
+    assert health.allow("wmo")
+
+    health.record_failure("wmo")
+    assert health.state("wmo") == "open"
+    assert not health.allow("wmo")
+    assert health.entries["wmo"]["open_until"] == now[0] + 900
+    assert health.state("accuweather") == "closed"
+
+
+def test_backoff_doubles_with_jitter_up_to_the_maximum(dw, clock):
+    _, spans = clock
+    health = dw.ProviderHealth()
+
+    for _ in range(9):
+        health.record_failure("wmo")
+
+    assert spans == [
+        (450, 900),
+        (900, 1800),
+        (1800, 3600),
+        (3600, 7200),
+        (7200, 14400),
+        (10800, 21600),
+        (10800, 21600),
+        (10800, 21600),
+    ]
+
+
+def test_half_open_then_closed(dw, clock):
+    now, _ = clock
+    health = dw.ProviderHealth()
+    health.record_failure("wmo")
+    health.record_failure("wmo")
+
+    now[0] += 900
+    assert health.state("wmo") == "half-open"
+    assert health.allow("wmo")
+
+    health.record_success("wmo")
+    assert health.state("wmo") == "closed"
+    assert "wmo" not in health.entries
+
+
+def test_half_open_then_open_for_longer(dw, clock):
+    now, _ = clock
+    health = dw.ProviderHealth()
+    health.record_failure("wmo")
+    health.record_failure("wmo")
+
+    now[0] += 900
+    health.record_failure("wmo")
+
+    assert health.state("wmo") == "open"
+    assert health.entries["wmo"]["open_until"] == now[0] + 1800
+
+
+def test_kept_between_runs(dw, clock, tmp_path):
+    path = tmp_path / "health.json"
+    health = dw.ProviderHealth(path)
+    health.record_failure("wmo")
+    health.record_failure("wmo")
+
+    assert dw.ProviderHealth(path).state("wmo") == "open"
+
+    health.record_success("wmo")
+    assert dw.ProviderHealth(path).state("wmo") == "closed"
+
+
+def test_unreadable_file_starts_closed(dw, tmp_path):
+    path = tmp_path / "health.json"
+    path.write_text("{not json")
+
+    assert dw.ProviderHealth(path).state("wmo") == "closed"
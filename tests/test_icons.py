@@ -0,0 +1,64 @@
+import pytest
+
+FCICONS = "http://www.nws.noaa.gov/weather/images/fcicons/"
+
+
+@pytest.mark.parametrize(
+    "name, icon",
+    [
+        ("skc", "skc"),
+        ("nskc", "skc"),
+        ("nbkn", "bkn"),
+        ("ra70", "ra"),
+        ("nra40", "ra"),
+        ("minus_ra", "ra"),
+        ("shra30", "shra"),
+        ("nshra60", "shra"),
+        ("hi_shwrs20", "hi_shwrs"),
+        ("hi_nshwrs30", "hi_shwrs"),
+        ("tsra50", "tsra"),
+        ("ntsra80", "tsra"),
+        ("scttsra20", "scttsra"),
+        ("nscttsra30", "scttsra"),
+        ("hi_tsra20", "scttsra"),
+        ("hi_ntsra20", "scttsra"),
+        ("nsvrtsra", "tsra"),
+        ("fzra", "fzra"),
+        ("nfzra90", "fzra"),
+        ("fzrara", "fzra"),
+        ("nfzrara50", "fzra"),
+        ("raip", "raip"),
+        ("nrasn", "rasn"),
+        ("mix", "mix"),
+        ("nsn", "sn"),
+        ("blizzard", "blizzard"),
+        ("nfg", "fg"),
+        ("hz", "fg"),
+        ("nwind", "wind"),
+        ("hurr-noh", "wind"),
+        ("ncold", "cold"),
+    ],
+)
+def test_ndfd_icon(dw, name, icon):
+    assert dw.NDFDIconTable()[f"{FCICONS}{name}.jpg"] == icon
+
+
+def test_ndfd_unknown_icon(dw):
+    assert dw.NDFDIconTable()[f"{FCICONS}zzz.jpg"] == dw.ICON_FALLBACK
+
+
+def test_ndfd_missing_icon(dw):
+    # a day without a forecast has an empty icon-link
+    table = dw.NDFDIconTable()
+    assert table[""] == dw.ICON_FALLBACK
+    assert table[None] == dw.ICON_FALLBACK
+
+
+def test_ndfd_column(dw):
+    urls = [f"{FCICONS}nsct.jpg", f"{FCICONS}hi_nshwrs30.jpg", ""]
+    assert dw.NDFDIconTable().normalize(urls) == ("sct", "hi_shwrs", "na")
+
+
+def test_code_table(dw):
+    table = dw.IconTable({1: "skc", 3: "sct"})
+    assert table.normalize([1, "3", 2, 99, None]) == ("skc", "sct", "na", "na", "na")
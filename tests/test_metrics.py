@@ -0,0 +1,71 @@
+import re
+
+
+def buckets(text, family="weather_render_seconds"):
+    return {
+        match.group(1): float(match.group(2))
+        for match in re.finditer(family + r'_bucket\{le="([^"]+)"\} (\S+)', text)
+    }
+
+
+def test_observe_writes_every_bucket(dw):
+    metrics = dw.Metrics()
+    metrics.observe("weather_render_seconds", 0.3)
+
+    text = metrics.render()
+
+    assert buckets(text) == {
+        "0.05": 0,
+        "0.1": 0,
+        "0.25": 0,
+        "0.5": 1,
+        "1.0": 1,
+        "2.5": 1,
+        "5.0": 1,
+        "10.0": 1,
+        "30.0": 1,
+        "60.0": 1,
+        "+Inf": 1,
+    }
+    assert "weather_render_seconds_count 1\n" in text
+    assert "weather_render_seconds_sum 0.3\n" in text
+
+
+def test_buckets_are_in_increasing_order(dw):
+    metrics = dw.Metrics()
+    metrics.observe("weather_render_seconds", 7)
+
+    bounds = [float(le.replace("+Inf", "inf")) for le in buckets(metrics.render())]
+
+    assert bounds == list(dw.Metrics.BUCKETS)
+
+
+def test_render_adds_to_previous(dw):
+    first = dw.Metrics()
+    first.observe("weather_render_seconds", 0.3)
+    first.inc("weather_failures_total", code=69)
+    first.set("weather_peak_rss_bytes", 100)
+    second = dw.Metrics()
+    second.observe("weather_render_seconds", 0.07)
+    second.inc("weather_failures_total", code=69)
+    second.set("weather_peak_rss_bytes", 200)
+
+    text = second.render(first.render())
+
+    assert buckets(text)["0.05"] == 0
+    assert buckets(text)["0.1"] == 1
+    assert buckets(text)["0.5"] == 2
+    assert buckets(text)["+Inf"] == 2
+    assert "weather_render_seconds_count 2\n" in text
+    assert 'weather_failures_total{code="69"} 2\n' in text
+    assert "weather_peak_rss_bytes 200\n" in text
+
+
+def test_render_skips_unknown_and_malformed_lines(dw):
+    metrics = dw.Metrics()
+    metrics.inc("weather_failures_total", code=75)
+
+    text = metrics.render('other_total 3\nweather_failures_total{code="75"} x\n')
+
+    assert "other_total" not in text
+    assert 'weather_failures_total{code="75"} 1\n' in text
@@ -0,0 +1,85 @@
+import struct
+import zlib
+
+import pytest
+
+
+def read_png(path):
+    """Decode the unfiltered grayscale PNGs write_png makes."""
+    data = path.read_bytes()
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    offset = 8
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        kind = data[offset + 4 : offset + 8]
+        body = data[offset + 8 : offset + 8 + length]
+        (crc,) = struct.unpack(">I", data[offset + 8 + length : offset + 12 + length])
+        assert crc == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    width, height, depth, color_type, _, _, _ = struct.unpack(">2I5B", chunks[b"IHDR"])
+    assert color_type == 0
+    stride = -(-width * depth // 8) + 1
+    raw = zlib.decompress(chunks[b"IDAT"])
+    pixels = bytearray()
+    for y in range(height):
+        row = raw[y * stride : (y + 1) * stride]
+        assert row[0] == 0
+        if depth == 1:
+            bits = "".join(f"{byte:08b}" for byte in row[1:])[:width]
+            pixels += bytes(255 if bit == "1" else 0 for bit in bits)
+        else:
+            pixels += row[1:]
+    assert b"IEND" in chunks
+    return width, height, depth, bytes(pixels)
+
+
+def gray(dw, level, width=8, height=8):
+    return dw.Raster(width, height, bytes([level]) * (width * height))
+
+
+def test_dither_keeps_black_and_white(dw):
+    raster = dw.Raster(4, 2, bytes([0, 255, 0, 255, 255, 255, 0, 0]))
+
+    assert dw.dither(raster) == raster
+
+
+@pytest.mark.parametrize("level, white", [(0, 0), (64, 4), (128, 8), (192, 12)])
+def test_dither_turns_gray_into_a_pattern(dw, level, white):
+    pixels = dw.dither(gray(dw, level, 4, 4)).pixels
+
+    assert set(pixels) <= {0, 255}
+    assert pixels.count(255) == white
+    # the lowest ranks of the Bayer matrix turn white first
+    assert [pixels[y * 4 + x] == 255 for y in range(4) for x in range(4)] == [
+        rank < white for row in dw.BAYER for rank in row
+    ]
+
+
+def test_dither_tiles_rows_of_any_width(dw):
+    pixels = dw.dither(gray(dw, 128, 6, 5)).pixels
+
+    rows = [pixels[y * 6 : (y + 1) * 6] for y in range(5)]
+    assert rows[4] == rows[0]
+    assert [row[4:] for row in rows] == [row[:2] for row in rows]
+
+
+def test_png_round_trip(dw, tmp_path):
+    pixels = bytes(range(0, 240, 4)) + bytes([255] * 4)
+    raster = dw.Raster(16, 4, pixels)
+    path = tmp_path / "weather.png"
+
+    dw.write_png(str(path), raster)
+
+    assert read_png(path) == (16, 4, 8, pixels)
+
+
+def test_bilevel_png_round_trip(dw, tmp_path):
+    # a width that isn't a multiple of 8 leaves padding bits in each row
+    raster = dw.dither(gray(dw, 100, 13, 7))
+    path = tmp_path / "weather.png"
+
+    dw.write_png(str(path), raster, bilevel=True)
+
+    assert read_png(path) == (13, 7, 1, raster.pixels)
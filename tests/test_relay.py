@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+def response(dw, status=200, body=b"{}"):
+    return dw.RelayResponse(status, "OK", "application/json", body)
+
+
+def test_concurrent_gets_fetch_once(dw):
+    cache = dw.RelayCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        started.set()
+        release.wait(5)
+        return response(dw)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        first = pool.submit(cache.get, "/wmo/1", fetch)
+        assert started.wait(5)
+        others = [pool.submit(cache.get, "/wmo/1", fetch) for _ in range(7)]
+        # give the others time to queue up behind the fetch; any that don't
+        # still find its response in the cache
+        time.sleep(0.1)
+        release.set()
+        results = [first.result()] + [other.result() for other in others]
+
+    assert len(fetches) == 1
+    assert results[0] == (response(dw), "miss")
+    assert {result for _, result in results[1:]} <= {"collapsed", "hit"}
+    assert all(body == response(dw) for body, _ in results)
+
+
+def test_hit_until_expired(dw):
+    cache = dw.RelayCache(ttl=60)
+    cache.get("/wmo/1", lambda: response(dw, body=b"1"))
+
+    assert cache.get("/wmo/1", lambda: response(dw, body=b"2")) == (
+        response(dw, body=b"1"),
+        "hit",
+    )
+    assert cache.get("/wmo/2", lambda: response(dw, body=b"3"))[1] == "miss"
+
+    expired = dw.RelayCache(ttl=0)
+    expired.get("/wmo/1", lambda: response(dw, body=b"1"))
+    assert expired.get("/wmo/1", lambda: response(dw, body=b"2")) == (
+        response(dw, body=b"2"),
+        "miss",
+    )
+
+
+def test_errors_are_not_kept(dw):
+    cache = dw.RelayCache(ttl=60)
+    cache.get("/wmo/1", lambda: response(dw, status=503))
+
+    assert cache.get("/wmo/1", lambda: response(dw))[1] == "miss"
+
+
+def test_failed_fetch_lets_waiters_fetch(dw):
+    cache = dw.RelayCache(ttl=60)
+
+    def fail():
+        raise OSError("unreachable")
+
+    with pytest.raises(OSError):
+        cache.get("/wmo/1", fail)
+
+    assert not cache.in_flight
+    assert cache.get("/wmo/1", lambda: response(dw)) == (response(dw), "miss")
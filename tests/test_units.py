@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "celsius, metric, text",
+    [
+        (20.0, True, "20"),
+        (20.0, False, "68"),
+        (21.5, True, "22"),
+        (-0.5, True, "0"),
+        (-1.5, True, "-1"),
+        (-40.0, False, "-40"),
+        (None, False, ""),
+    ],
+)
+def test_format_temperature(dw, celsius, metric, text):
+    assert dw.format_temperature(celsius, metric) == text
+
+
+def test_fahrenheit_survives_the_round_trip(dw):
+    getter = dw.WeatherGovGetter(dw.ZipCode("12345"))
+
+    for fahrenheit in range(-60, 131):
+        celsius = getter._temperature(str(fahrenheit))
+        assert dw.format_temperature(celsius, False) == str(fahrenheit)
+
+
+def test_celsius_is_kept_as_given(dw):
+    getter = dw.WMOGetter(dw.CityID(1))
+
+    assert getter._temperature("21.5") == 21.5
+    assert getter._temperature("") is None
+    assert getter._temperature(None) is None
+
+
+def test_fahrenheit_is_converted(dw):
+    getter = dw.WeatherGovGetter(dw.ZipCode("12345"))
+
+    assert getter._temperature("68") == 20.0
+    assert getter._temperature("70") == 21.11
+    assert getter._temperature("-40") == -40.0
+
+
+@pytest.mark.parametrize(
+    "kmh, direction, metric, text",
+    [
+        (16.09344, "N", False, "10 mph N"),
+        (16.09344, "N", True, "16 km/h N"),
+        (24.0, "SW", False, "15 mph SW"),
+        (24.0, "SW", True, "24 km/h SW"),
+        (0.0, "", True, "0 km/h"),
+        (None, "N", False, ""),
+    ],
+)
+def test_format_wind(dw, kmh, direction, metric, text):
+    assert dw.format_wind(kmh, direction, metric) == text
+
+
+@pytest.mark.parametrize("metric, unit, high", [(False, "F", "68"), (True, "C", "20")])
+def test_one_forecast_fills_either_unit(dw, metric, unit, high):
+    getter = dw.WMOGetter(dw.CityID(1), metric=metric)
+    getter._forecast = dw.Forecast(
+        first_date=date(2026, 10, 19),
+        highs=(20.0,),
+        lows=(None,),
+        icons=("skc",),
+        wind_speeds=(16.09344,),
+        wind_directions=("N",),
+    )
+
+    substitutions = dict(getter.base_substitutions(), **getter.forecast_substitutions())
+
+    assert substitutions["UNIT"] == unit
+    assert substitutions["HIGH_ONE"] == high
+    assert substitutions["LOW_ONE"] == ""
+    assert substitutions["WIND_ONE"] == ("16 km/h N" if metric else "10 mph N")